@@ -0,0 +1,115 @@
+"""
+Measures the result page cache on repeated browsing of popular filters.
+
+    python ./src/bench_pages.py events.jsonl.gz --clicks 5000
+
+Loads a recording made with RECORD_EVENTS (see src/replay.py) into a scratch database,
+then clicks through rating, recommender, genre and tag results, with a few filters far
+more popular than the rest, once with the cache disabled and once with it enabled.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from dataclasses import replace
+
+from bench_records import _parse_all
+from db.models import ParsedRecommendation, ParsedRating
+from helpers.config import load_config
+from replay import ReplayHarness, make_ingestor, set_up_guilds
+from views import pages
+from views.ratings import _build_embed_table as build_ratings_table
+from views.recommendations import _build_embed_table as build_recommendations_table
+
+
+def _filters(db):
+    """Every (key, query, build_table) a user can browse, across all guilds."""
+    filters = []
+    for guild_id in db.get_guild_ids():
+        for value in range(1, 11):
+            filters.append((('rating', guild_id, value),
+                            lambda g=guild_id, v=value: db.get_tracks_by_rating(g, v), build_ratings_table))
+        for name in db.get_all_recommended_by(guild_id):
+            filters.append((('recommended_by', guild_id, name),
+                            lambda g=guild_id, v=name: db.get_tracks_by_recommended_by(g, v), build_ratings_table))
+        for genre in db.get_all_genres(guild_id):
+            filters.append((('genre', guild_id, genre),
+                            lambda g=guild_id, v=genre: db.get_recommendations_by_genre(g, v), build_recommendations_table))
+        for tag in db.get_all_tags(guild_id):
+            filters.append((('tag', guild_id, tag),
+                            lambda g=guild_id, v=tag: db.get_recommendations_by_tag(g, v), build_recommendations_table))
+    return filters
+
+
+def _browse(db, clicks, filters, weights, seed):
+    """Opens a weighted random filter and pages through some of it, `clicks` times."""
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    for _ in range(clicks):
+        key, query, build_table = rng.choices(filters, weights)[0]
+        _, _, page_count = pages.get_page(db, key, 0, query, build_table)
+        for page in range(1, min(page_count, rng.randint(1, 3))):
+            pages.get_page(db, key, page, query, build_table)
+    return time.perf_counter() - start
+
+
+def _run(label, db, clicks, filters, weights, cache_size, statements):
+    pages.result_pages = pages.PageCache(cache_size)
+    statements.clear()
+    elapsed = _browse(db, clicks, filters, weights, seed=1)
+    cache = pages.result_pages
+    lookups = cache.hits + cache.misses
+    print(f'{label}: {clicks} clicks in {elapsed:.3f}s ({elapsed / clicks * 1e6:.1f} us/click), '
+          f'{len(statements)} SQL statements')
+    print(f'  {cache.summary()}, {lookups} page lookups')
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the result page cache.')
+    parser.add_argument('recording', help='JSONL recording, optionally gzip compressed')
+    parser.add_argument('--clicks', type=int, default=5000, help='Result pages opened per run')
+    parser.add_argument('--cache-size', type=int, default=512, help='Pages kept by the cache')
+    args = parser.parse_args()
+
+    ingestor = make_ingestor(':memory:')
+    db = ingestor.db
+    logging.basicConfig(level=logging.WARNING)
+
+    harness = ReplayHarness()
+    events = harness.load(args.recording)
+    set_up_guilds(db, events, load_config()[2])
+    records = asyncio.run(_parse_all(ingestor, [message for _, message in events]))
+    db.insert_recommendations([r for r in records if isinstance(r, ParsedRecommendation)])
+    db.insert_ratings([r for r in records if isinstance(r, ParsedRating)])
+
+    filters = _filters(db)
+    # Zipf-like popularity: the first few filters get most of the clicks
+    weights = [1 / (rank + 1) for rank in range(len(filters))]
+    random.Random(0).shuffle(filters)
+    print(f'{len(records)} records, {len(filters)} filters')
+
+    statements = []
+    db.connect().set_trace_callback(statements.append)
+    _run('Uncached', db, args.clicks, filters, weights, 0, statements)
+    cache = _run('Cached', db, args.clicks, filters, weights, args.cache_size, statements)
+
+    # Browse the same filters again on the warm cache: nothing should reach SQLite
+    statements.clear()
+    hits, misses = cache.hits, cache.misses
+    elapsed = _browse(db, args.clicks, filters, weights, seed=1)
+    print(f'Warm repeat: {args.clicks} clicks in {elapsed:.3f}s ({elapsed / args.clicks * 1e6:.1f} us/click), '
+          f'{len(statements)} SQL statements, {cache.hits - hits} hits, {cache.misses - misses} misses')
+
+    # One write invalidates every cached page
+    rating = next(r for r in records if isinstance(r, ParsedRating))
+    db.insert_rating(replace(rating, message_id=f'{rating.message_id}-bench'))
+    key, query, build_table = filters[0]
+    stale = cache.stale
+    pages.get_page(db, key, 0, query, build_table)
+    print(f'After a write: {cache.stale - stale} stale lookup, rebuilt from SQLite')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Measures memory held per in-flight item during a backfill: a message object versus the
+slotted records the backfill converts it into, and sqlite3.Row versus RatingRow results.
+
+    python ./src/bench_records.py events.jsonl.gz
+
+Uses a recording made with RECORD_EVENTS (see src/replay.py). The replayed messages are
+lighter than real discord.py Messages, so the message numbers are a lower bound.
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import tracemalloc
+
+from db.db_connector import RATING_COLUMNS
+from db.models import ParsedRecommendation, RatingRow
+from helpers.config import load_config
+from replay import ReplayHarness, make_ingestor, set_up_guilds
+
+
+def _measure(build):
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before
+
+
+async def _parse_all(ingestor, messages):
+    records = []
+    for message in messages:
+        parsed = await ingestor.parse_message(message)
+        if parsed:
+            records.extend(parsed)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare memory per item for messages, records and rows.')
+    parser.add_argument('recording', help='JSONL recording, optionally gzip compressed')
+    args = parser.parse_args()
+
+    ingestor = make_ingestor(':memory:')
+    db = ingestor.db
+    logging.basicConfig(level=logging.WARNING)
+
+    tracemalloc.start()
+    gc.collect()
+    baseline = tracemalloc.get_traced_memory()[0]
+    harness = ReplayHarness()
+    events = harness.load(args.recording)
+    messages = [message for _, message in events]
+    set_up_guilds(db, events, load_config()[2])
+    message_count = len(harness.messages)
+    gc.collect()
+    message_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    records = asyncio.run(_parse_all(ingestor, messages))
+    # Drop the messages, as the backfill does, and see what the records alone keep alive
+    del events, messages
+    harness.messages.clear()
+    harness.channels.clear()
+    gc.collect()
+    record_bytes = tracemalloc.get_traced_memory()[0] - baseline
+
+    print(f'Messages: {message_count}, {message_bytes / max(message_count, 1):.0f} bytes each')
+    print(f'Records:  {len(records)}, {record_bytes / max(len(records), 1):.0f} bytes each')
+
+    db.insert_recommendations([r for r in records if isinstance(r, ParsedRecommendation)])
+    db.insert_ratings([r for r in records if not isinstance(r, ParsedRecommendation)])
+    del records
+    conn = db.connect()
+
+    def fetch_rows():
+        return conn.execute(f'SELECT {RATING_COLUMNS} FROM ratings').fetchall()
+
+    def fetch_dataclasses():
+        return [RatingRow(*row) for row in conn.execute(f'SELECT {RATING_COLUMNS} FROM ratings')]
+
+    rows, row_bytes = _measure(fetch_rows)
+    row_count = len(rows)
+    del rows
+    typed, typed_bytes = _measure(fetch_dataclasses)
+    del typed
+
+    print(f'Rating rows: {row_count}, sqlite3.Row {row_bytes / max(row_count, 1):.0f} bytes each, '
+          f'RatingRow {typed_bytes / max(row_count, 1):.0f} bytes each')
+
+
+if __name__ == '__main__':
+    main()
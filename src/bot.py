@@ -1,46 +1,71 @@
+from helpers.startup import Startup
+
+# Setup runs in timed phases. The slow parts (Discord login, search index) happen
+# after import, and commands check startup.ready instead of waiting on them.
+startup = Startup()
+startup.begin('imports')
+import asyncio
 import discord
-import re
+import hashlib
 import logging
 import os
-from dotenv import load_dotenv
-from datetime import datetime, timezone, timedelta
-from db.db_connector import DBConnector
-from views.ratings import RatingsStartView
-from views.recommendations import RecommendationsStartView
-from helpers.messages import *
-from helpers.spotify import get_artist_from_spotify_link
-from discord.ext import commands
 import time
-import json
+from db.db_connector import DBConnector
+from db.backup import BackupManager
+from db.jobs import JobQueue
+from db.journal import IngestJournal
+from db.models import GuildSettings
+from views.menu import MenuButton, SCREENS, display_name
+from views.pages import result_pages, send_results
+# Imported for the screens and result kinds they register
+import views.ratings
+import views.recommendations
+from helpers.config import load_config
+from helpers.recorder import EventRecorder
+from helpers.logs import setup_logging
+from helpers.prefix_index import GuildSearchIndexes
+from ingest import Ingestor
+from discord import app_commands
+from discord.ext import commands, tasks
+startup.end('imports')
+
+startup.begin('config')
+environment, db_path, vars = load_config()
 
 # Set up logging
-logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s',
-                    level=logging.INFO,
-                    datefmt='%Y-%m-%d %H:%M:%S')
+# Records are handed to a background thread through a queue, so the event loop never
+# waits on stdout. High volume info events can be sampled or rate limited per event type.
+setup_logging(level=logging.INFO,
+              log_format=vars.get('log_format', 'json'),
+              sample_rates=vars.get('log_sample_rates'),
+              rate_limits=vars.get('log_rate_limits'))
 logger = logging.getLogger('discord')
 logger.setLevel(logging.INFO)
-
-# Load environment variables - don't forget to configure .env for production
-if os.path.exists('.env'):
-    load_dotenv()
-    environment = os.getenv('ENVIRONMENT', 'development')
-else:
-    environment = os.environ.get('ENVIRONMENT', 'development')
-
-if environment == 'production':
-    db_path = 'db/rutta-dj-prod.sqlite3'
-    logging.info('Running in production mode')
-    vars = json.load(open('config/prod.json'))
-else:
-    db_path = 'db/rutta-dj-dev.sqlite3'
-    vars = json.load(open('config/dev.json'))
-    logging.info('Running in development mode')
+logging.info('Running in %s mode', environment)
 
 # Set up configuration variables
 # These can be overridden by environment variables for flexibility
+# Channels and controlling user are per guild now (see the configure command). These
+# are only used to set up guilds that were running before that, on first start.
 TRACK_LIST_CHANNEL = vars.get('track_list_channel', 'test-track-list')
 MUSIC_REVIEW_CHANNEL = vars.get('music_review_channel', 'test-music-review')
 CONTROLLING_USER = vars.get('controlling_user', 'longliveHIM').lower()
+BACKFILL_BATCH_SIZE = vars.get('backfill_batch_size', 500)
+BACKUP_DIR = vars.get('backup_dir', 'db/backups')
+BACKUP_KEEP = vars.get('backup_keep', 7)
+BACKUP_INTERVAL_HOURS = vars.get('backup_interval_hours', 24)
+# 'inline' does everything in this process. 'worker' hands ingest, backfill and backups
+# to src/worker.py through a job table and only reads the archive here.
+INGEST_MODE = os.environ.get('INGEST_MODE', vars.get('ingest_mode', 'inline'))
+JOB_POLL_SECONDS = vars.get('job_poll_seconds', 5)
+# How often messages that couldn't be archived are retried from the ingest journal, 0 to turn it off
+INGEST_RETRY_SECONDS = vars.get('ingest_retry_seconds', 60)
+JOURNAL_KEEP_DAYS = vars.get('journal_keep_days', 30)
+
+# Set RECORD_EVENTS to a .jsonl.gz path to capture incoming messages for src/replay.py
+RECORD_EVENTS = os.environ.get('RECORD_EVENTS')
+recorder = EventRecorder(RECORD_EVENTS) if RECORD_EVENTS else None
+startup.end('config')
 
 # Set up Discord client with intents
 # Enable message content intent to read message content
@@ -49,183 +74,79 @@ intents.message_content = True
 intents.messages = True
 intents.members = True
 
-client = commands.Bot(command_prefix=commands.when_mentioned, intents=intents)
+# AutoShardedBot picks the shard count Discord recommends, or shard_count from the config.
+# The operators in owner_ids (Discord user ids) run the bot itself, e.g. take backups of the
+# whole archive. Without it the application's owner on the Developer Portal is the operator.
+client = commands.AutoShardedBot(command_prefix=commands.when_mentioned, intents=intents,
+                                 shard_count=vars.get('shard_count'),
+                                 owner_ids=set(vars.get('owner_ids', [])))
 
 # Set up DB connection
+startup.begin('database')
 try:
     db = DBConnector(db_path)
-    db.create_tables()
-    logging.info('Database connection established and tables created.')
+    applied = db.create_tables()
+    settings_db = db
+    if INGEST_MODE == 'worker':
+        # The worker owns all archive writes, this process only serves views.
+        # Guild settings are the exception and get their own writable connection.
+        db = DBConnector(db_path, read_only=True)
+        jobs = JobQueue(db_path.replace('.sqlite3', '-jobs.sqlite3'))
+        jobs.create_tables()
+    # Messages are journaled before they're archived, see the failures command
+    journal = IngestJournal(db_path.replace('.sqlite3', '-journal.sqlite3'))
+    journal.create_tables()
+    logging.info('Database connection established, %s migrations applied.', applied)
 except Exception as e:
-    logging.error(f'Error setting up database: {e}')
+    logging.error('Error setting up database: %s', e)
     raise
-
-
-def create_rating_embed(title, author, link, rating, explanation):
-    try:
-        embed = discord.Embed(title=f'Rating for {title}',
-                              description=explanation)
-        embed.set_thumbnail(url=client.user.avatar.url)
-        embed.add_field(name='Author', value=author, inline=True)
-        embed.add_field(name='Link', value=link, inline=True)
-        embed.add_field(name='Rating', value=rating, inline=True)
-        embed.set_footer(text='Rutta DJ Bot')
-    except Exception as e:
-        logging.error(f'Error creating rating embed: {e}')
-        embed = discord.Embed(title='Error',
-                              description='Failed to create rating embed.')
-        embed.set_thumbnail(url=client.user.avatar.url)
-        embed.set_footer(text='Rutta DJ Bot')
-    return embed
-
-
-def create_recommendation_embed(title, author, link, genre, tag):
-    try:
-        embed = discord.Embed(title=f'Recommendation: {title}',
-                              description=f'Genre: {genre}\nTag: {tag}')
-        embed.set_thumbnail(url=client.user.avatar.url)
-        embed.add_field(name='Author', value=author, inline=True)
-        embed.add_field(name='Link', value=link, inline=True)
-        embed.set_footer(text='Rutta DJ Bot')
-    except Exception as e:
-        logging.error(f'Error creating recommendation embed: {e}')
-        embed = discord.Embed(
-            title='Error',
-            description='Failed to create recommendation embed.')
-        embed.set_thumbnail(url=client.user.avatar.url)
-        embed.set_footer(text='Rutta DJ Bot')
-    return embed
-
-async def process_message(message):
-    if str(message.author.global_name).lower() != CONTROLLING_USER:
-        return False
-    
-    if message.channel.name == TRACK_LIST_CHANNEL:
-        return await process_track_list_message(message)
-    elif message.channel.name == MUSIC_REVIEW_CHANNEL:
-        return await process_music_review_message(message)
-    
-async def process_track_list_message(message): 
-    # Expecting format:
-    # Genre - Tag\nhttps://www.youtube.com/watch?v=4hz68I4BRMA
-    # OR:
-    # @Genre[s] - Tag\nhttps://www.youtube.com/watch?v=4hz68I4BRMA
-    logging.info(f'Received message from {message.author.global_name} in {TRACK_LIST_CHANNEL}: {message.content}')
-    if (message.created_at + timedelta(seconds = 60) > datetime.now(timezone.utc)): time.sleep(5) #Pray the embed is generated :)
-    try:
-        text = message.content.strip()
-        lines = text.split('\n')
-        if len(lines) < 2:
-            logging.error(f'Invalid format in message: {text}')
-            return False
-        
-        genre_tag_line = lines[0].strip().split('-')
-        if len(genre_tag_line) < 2:
-            logging.error(f'Invalid genre-tag format in message: {text}')
-            return False
-        genres = re.findall(r'<@&\d+>', genre_tag_line[0])
-        if not genres:
-            genres = genre_tag_line[0].strip().split(' ')
-        if len(genres) < 2:
-            genres.append('')  # Ensure we have at least two genres
-        tag = genre_tag_line[-1].strip()
-        
-        if message.embeds:
-            embed = message.embeds[0]
-            title, author, link = parse_embed(embed)
-        else:
-            logging.error(f'Message {message.content} does not contain an embed.')
-            return False
-        if not title:
-            logging.error(f'Missing title in replied message: {message.content}')
-            return False
-        if not link:
-            logging.error(f'Missing link in replied message: {message.content}')
-            return False
-        if not author:
-            author = get_artist_from_spotify_link(link)
-        if not author:
-            logging.error(f'Missing author in replied message: {message.content}') 
-            return False
-        
-        db.insert_recommendation(message.id, author, title, link, genres, tag)
-        logging.info(f'Recommendation inserted: {title} by {author} ({link}) with genres {genres} and tag {tag}')
-        curr_time = datetime.now(timezone.utc)
-        diff = curr_time - message.created_at
-        if diff.total_seconds() < 360:
-            embed = create_recommendation_embed(title, author, link, ' '.join(genres), tag)
-            await message.channel.send(embed=embed)
-
-    except Exception as e:
-        logging.error(f'Error processing track list message: {e}')
-        return False
-
-async def process_music_review_message(message):
-    # If Rutta is rating a track, he should be replying to a message with the song link
-    # This assumes that the embed is in the replied message and has already been generated. Might break if embed isn't generated or there's a lot of lag
-    if not message.reference:
-        logging.error(f'Message {message.id} is not a reply to a recommendation.')
-        return False
-    
-    try:
-        #look for the replied message and embed and parse it if present
-        replied_message = await message.channel.fetch_message(message.reference.message_id)
-        if not replied_message.embeds:
-            logging.error(f'Replied message {replied_message.id} does not contain an embed.')
-            return False
-        embed = replied_message.embeds[0]
-        title, author, link = parse_embed(embed)
-        if not title:
-            logging.error(f'Missing title in replied message: {replied_message.content}')
-            return False
-        if not link:
-            logging.error(f'Missing link in replied message: {replied_message.content}')
-            return False
-        if not author:
-            author = get_artist_from_spotify_link(link)
-        if not author:
-            logging.error(f'Missing author in replied message: {replied_message.content}')
-            return False
-        
-        # Check if we're looking at an album or a track
-        # Review format expected:
-
-        # Title - Rating\nExplanation
-        # Example: "Track Name - 5\nThis track is amazing!"
-
-        # OR
-        
-        # Rating\nExplanation
-        # Example: "5\nThis track is amazing!"
-        # use re to find all ratings and explanations, if findall returns more than one and the title contains album or discography, assume it's an album review
-        # This regex matches: optional title, rating, and explanation
-        # Example: "Track Title - 5\nExplanation" or "5\nExplanation"
-
-        #WARNING CURSED REGEX HIDE YOUR EYES I'M SO SORRY
-        tracks_to_process = re.findall(r"(?:^|\n)(?:(.+?)\s*-\s*)?(\d+(?:\.\d+)?)\n(.+?)(?=\n(?:.+?\s*-\s*)?\d+(?:\.\d+)?\n|$)", message.content)
-        if 'album' in title.lower() or 'discography' in title.lower() or len(tracks_to_process) > 1:
-            logging.info(f'Processing album recommendation: {title}')
-        for idx, track in enumerate(tracks_to_process):
-            track_name, rating, explanation = track
-            if not track_name:
-                track_name = title
-            if not rating or not explanation:
-                logging.error(f'Missing rating or explanation in message: {message.content}')
-                return False
-            #If it's an album the title might start with Track 1 - track_name or Track 1: track_name. We want to strip the Track [Integer] -  or Track [Integer]: part
-            track_name = re.sub(r'^Track \d+ - |^Track \d+: ', '', track_name.strip())
-            unique_id = f"{message.id}-{idx}" if len(tracks_to_process) > 1 else message.id
-            db.insert_rating(unique_id, replied_message.author.global_name, track_name, link, rating, explanation)
-            embed = create_rating_embed(track_name, author, link, rating, explanation)
-            logging.info(f'Rating inserted: {track_name} by {author} ({link}) with rating {rating} and explanation "{explanation}"')
-            curr_time = datetime.now(timezone.utc)
-            diff = curr_time - message.created_at
-            if diff.total_seconds() < 360:
-                await message.channel.send(embed=embed)
-        return True
-    except Exception as e:
-        logging.error(f'Error processing music review message: {e}')
-        return False
+startup.end('database')
+
+backups = BackupManager(db, BACKUP_DIR, keep=BACKUP_KEEP)
+
+# In-memory prefix indexes per guild for slash command autocomplete, kept current on insert.
+# Empty until warm_caches fills it after on_ready.
+search_index = GuildSearchIndexes()
+warm_up = None
+# Reads rows for the indexes on a worker thread, with its own connection so the
+# commands on the event loop never queue behind it
+index_reader = DBConnector(db_path, read_only=True)
+
+# Rendered result pages, invalidated by any write to the archive
+result_pages.max_entries = vars.get('page_cache_size', 512)
+
+ingestor = Ingestor(db, client, search_index=search_index, batch_size=BACKFILL_BATCH_SIZE,
+                    ingest_journal=journal)
+
+# Menu buttons find the archive through interaction.client
+client.db = db
+
+
+def _describe_job(job, label):
+    if job.status == 'queued':
+        return f"{label} queued as job #{job.id}."
+    counts = (f"Processed: {job.processed} new records\n"
+              f"Already archived: {job.duplicates} records\n"
+              f"Skipped: {job.skipped} messages (not target user or could not be parsed)")
+    if job.status == 'running':
+        return f"{label} running (job #{job.id})...\n" + (counts if job.kind == 'backfill' else '')
+    if job.status == 'failed':
+        return f"{label} failed: {job.result}"
+    return f"{label} complete!\n" + (counts if job.kind == 'backfill' else job.result or '')
+
+
+async def report_job(ctx, job_id, label):
+    """Keeps a status message in the command's channel up to date until the worker finishes the job."""
+    job = jobs.get(job_id)
+    last = _describe_job(job, label)
+    status_message = await ctx.send(last)
+    while not job.finished:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        job = jobs.get(job_id)
+        text = _describe_job(job, label)
+        if text != last:
+            await status_message.edit(content=text)
+            last = text
 
 # async def process_message(message):
 #     if message.author == client.user:
@@ -336,72 +257,375 @@ async def process_music_review_message(message):
 
 @client.event
 async def on_ready():
-    logging.info(f'Logged in as {client.user}')
+    logging.info('Logged in as %s with %s shards in %s guilds', client.user, client.shard_count, len(client.guilds))
+    startup.end('login and gateway')
+    global warm_up
+    if warm_up is None:
+        # on_ready fires again after reconnects, only warm up once
+        warm_up = asyncio.create_task(warm_caches())
+    if not log_page_cache_stats.is_running():
+        log_page_cache_stats.start()
+    if BACKUP_INTERVAL_HOURS and INGEST_MODE != 'worker' and not scheduled_backup.is_running():
+        scheduled_backup.change_interval(hours=BACKUP_INTERVAL_HOURS)
+        scheduled_backup.start()
+    if INGEST_RETRY_SECONDS and INGEST_MODE != 'worker' and not retry_failed_ingest.is_running():
+        retry_failed_ingest.change_interval(seconds=INGEST_RETRY_SECONDS)
+        retry_failed_ingest.start()
+
+
+def _claim_legacy_guild(guild_id):
+    """
+    Saves the config file's settings for guild_id and gives it the legacy rows, unless some
+    guild is set up already. Returns the number of rows claimed, or None. Claiming rewrites
+    every legacy row, so this runs on a thread with a connection of its own.
+    """
+    conn = DBConnector(db_path)
+    try:
+        if conn.get_all_guild_settings():
+            return None
+        conn.save_guild_settings(GuildSettings(guild_id, TRACK_LIST_CHANNEL, MUSIC_REVIEW_CHANNEL, CONTROLLING_USER))
+        return conn.claim_legacy_rows(guild_id)
+    finally:
+        conn.close()
+
+
+async def set_up_legacy_guild():
+    """
+    The first time the bot starts with per-guild settings, gives the guild that has the
+    configured channels those settings and the rows archived before guilds were tracked.
+    """
+    for guild in client.guilds:
+        names = {ch.name for ch in guild.text_channels}
+        if TRACK_LIST_CHANNEL in names or MUSIC_REVIEW_CHANNEL in names:
+            claimed = await asyncio.to_thread(_claim_legacy_guild, guild.id)
+            if claimed is not None:
+                ingestor.forget_settings(guild.id)
+                logging.info('Set up %s from the config file and gave it %s existing rows', guild.name, claimed)
+            return
+
+
+async def warm_caches():
+    """
+    Sets up the legacy guild and builds the search indexes, both on threads with their own
+    connections so events keep flowing. Rows archived during the build are caught up after.
+    """
+    global search_index_version
+    try:
+        with startup.phase('guild setup'):
+            await set_up_legacy_guild()
+    except Exception as e:
+        logging.error('Error setting up guild from the config file: %s', e)
+    try:
+        with startup.phase('search index'):
+            search_index_version = db.data_version()
+            search_index.adopt(await asyncio.to_thread(GuildSearchIndexes.build, index_reader))
+            ratings, recs = await asyncio.to_thread(search_index.read_new_rows, index_reader)
+            search_index.catch_up(ratings, recs)
+    except Exception as e:
+        logging.error('Error warming search index: %s', e)
+    startup.mark_ready()
+    if INGEST_MODE == 'worker' and not refresh_search_index.is_running():
+        # Inserts happen in the worker, so pick them up from the archive instead
+        refresh_search_index.start()
+
+
+@tasks.loop(hours=24)
+async def scheduled_backup():
+    try:
+        await backups.run()
+    except Exception as e:
+        logging.error('Error running scheduled backup: %s', e)
+
+
+@tasks.loop(seconds=60)
+async def retry_failed_ingest():
+    try:
+        await ingestor.retry_journal(JOURNAL_KEEP_DAYS)
+    except Exception as e:
+        logging.error('Error retrying failed messages: %s', e)
+
+
+@tasks.loop(hours=1)
+async def log_page_cache_stats():
+    logging.info('Result page cache: %s', result_pages.summary())
+
+
+search_index_version = None
+
+
+@tasks.loop(seconds=30)
+async def refresh_search_index():
+    global search_index_version
+    try:
+        version = db.data_version()
+        if version != search_index_version:
+            search_index_version = version
+            # Only rows the worker archived since the last check are read, and only the
+            # guilds they belong to are updated
+            ratings, recs = await asyncio.to_thread(search_index.read_new_rows, index_reader)
+            search_index.catch_up(ratings, recs)
+    except Exception as e:
+        logging.error('Error refreshing search index: %s', e)
+
+
+@client.command()
+async def backup(ctx):
+    logging.info('Received request to back up the database')
+    # A snapshot covers every guild, so it's for the bot's operators, not a guild's controlling user
+    if not await client.is_owner(ctx.author):
+        await ctx.send("Only the bot's operators can take backups.")
+        return
+    if INGEST_MODE == 'worker':
+        await report_job(ctx, jobs.enqueue('backup', ctx.channel.id), 'Backup')
+        return
+    if backups.running:
+        await ctx.send("A backup is already running.")
+        return
+
+    try:
+        await ctx.send("Starting backup...")
+        result = await backups.run()
+        await ctx.send(f"Backup complete!\n{result.summary()}")
+    except Exception as e:
+        logging.error('Error backing up database: %s', e)
+        await ctx.send(f"Error backing up database: {e}")
 
 
 @client.command()
 #@commands.has_permissions(administrator=True)
 async def process(ctx):
-    logging.info(f'Received request to process history')
+    logging.info('Received request to process history')
+    settings = db.get_guild_settings(ctx.guild.id) if ctx.guild else None
+    if not settings:
+        await ctx.send("This server isn't set up yet. Use `configure` first.")
+        return
+    if INGEST_MODE == 'worker':
+        await report_job(ctx, jobs.enqueue('backfill', ctx.channel.id), 'Historical processing')
+        return
 
     try:
-        channels = [ch for ch in client.get_all_channels() if ch.name in [TRACK_LIST_CHANNEL, MUSIC_REVIEW_CHANNEL] and isinstance(ch, discord.TextChannel)]
+        channels = [ch for ch in ctx.guild.text_channels if ch.name in (settings.track_list_channel, settings.music_review_channel)]
         
         if not channels:
-            await ctx.send(f"Target channel {channel} not found!")
+            await ctx.send(f"Target channels {settings.track_list_channel} and {settings.music_review_channel} not found!")
             return
 
-        processed_count = 0
-        skipped_count = 0
-
-        # Process messages in batches to avoid memory issues
-        for channel in channels:
-            logging.info(f'Starting historical processing in {channel}')
-            async for message in channel.history(limit=100000, oldest_first=True):
-                if await process_message(message):
-                    processed_count += 1
-                else:
-                    skipped_count += 1
-            logging.info(
-                f'Processed {processed_count} messages, skipped {skipped_count} messages.'
-            )
+        stats = await ingestor.backfill(channels)
 
         await ctx.send(
             f"Historical processing complete!\n"
-            f"Processed: {processed_count} new messages\n"
-            f"Skipped: {skipped_count} messages (already processed or not target user)"
-        )
-        logging.info(
-            f'Historical processing complete: {processed_count} processed, {skipped_count} skipped.'
+            f"Processed: {stats.processed} new records\n"
+            f"Already archived: {stats.duplicates} records\n"
+            f"Skipped: {stats.skipped} messages (not target user or could not be parsed)"
         )
+        logging.info('Historical processing complete: %s processed, %s already archived, %s skipped.',
+                     stats.processed, stats.duplicates, stats.skipped)
 
     except Exception as e:
-        logging.error(f'Error processing history: {e}')
+        logging.error('Error processing history: %s', e)
         await ctx.send(f"Error processing history: {e}")
 
 
+CONFIGURABLE_SETTINGS = ('track_list_channel', 'music_review_channel', 'controlling_user')
+
+
+@client.command()
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def configure(ctx, setting: str = None, *, value: str = None):
+    """Shows or changes this server's channels and controlling user."""
+    logging.info('Received request to configure %s: %s = %s', ctx.guild.id, setting, value)
+    settings = settings_db.get_guild_settings(ctx.guild.id) or GuildSettings(ctx.guild.id, '', '', '')
+    if setting is None:
+        await ctx.send(
+            f"Track list channel: {settings.track_list_channel or 'not set'}\n"
+            f"Music review channel: {settings.music_review_channel or 'not set'}\n"
+            f"Controlling user: {settings.controlling_user or 'not set'}\n"
+            f"Change one with `configure <{'|'.join(CONFIGURABLE_SETTINGS)}> <value>`"
+        )
+        return
+    if setting not in CONFIGURABLE_SETTINGS or not value:
+        await ctx.send(f"Usage: `configure <{'|'.join(CONFIGURABLE_SETTINGS)}> <value>`")
+        return
+    setattr(settings, setting, value.strip().lstrip('#'))
+    try:
+        settings_db.save_guild_settings(settings)
+        ingestor.forget_settings(ctx.guild.id)
+        await ctx.send(f"Set {setting} to {getattr(settings, setting)}.")
+    except Exception as e:
+        logging.error('Error saving guild settings: %s', e)
+        await ctx.send(f"Error saving settings: {e}")
+
+
+def _describe_journal_entry(entry):
+    link = f"https://discord.com/channels/{entry.guild_id}/{entry.channel_id}/{entry.message_id}"
+    if entry.status == 'failed':
+        when = f"retrying <t:{entry.next_attempt_at}:R>" if entry.next_attempt_at else "retrying soon"
+    else:
+        when = "gave up"
+    return f"{link} ({entry.route}, {entry.attempts} attempts, {when}): {(entry.last_error or 'no error recorded')[:200]}"
+
+
+@client.command()
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def failures(ctx, action: str = None):
+    """Shows messages that couldn't be archived, or retries them all with `failures retry`."""
+    logging.info('Received request for ingest failures in %s: %s', ctx.guild.id, action)
+    try:
+        if action == 'retry':
+            # The worker or the retry task picks them up on its next run
+            requeued = journal.requeue_failures(ctx.guild.id, int(time.time()))
+            await ctx.send(f"Queued {requeued} messages to be retried.")
+            return
+        if action is not None:
+            await ctx.send("Usage: `failures` or `failures retry`")
+            return
+        counts = journal.count(ctx.guild.id)
+        entries = journal.get_failures(ctx.guild.id)
+    except Exception as e:
+        logging.error('Error reading ingest journal: %s', e)
+        await ctx.send(f"Error reading ingest journal: {e}")
+        return
+    lines = [f"Archived: {counts.get('done', 0)}, in progress: {counts.get('pending', 0)}, "
+             f"failed: {counts.get('failed', 0)}, gave up: {counts.get('abandoned', 0)}"]
+    if entries:
+        footer = "Use `failures retry` to retry them now."
+        for entry in entries:
+            line = _describe_journal_entry(entry)
+            # Stay under Discord's 2000 character message limit
+            if sum(len(l) + 1 for l in lines) + len(line) + len(footer) + 1 > 2000:
+                break
+            lines.append(line)
+        lines.append(footer)
+    await ctx.send('\n'.join(lines))
+
+
 @client.command()
 async def ratings(ctx):
-    logging.info(f'Received request to show ratings')
-    view = RatingsStartView(db=db)
+    logging.info('Received request to show ratings')
+    screen = SCREENS['ratings'](db, ctx.guild, '', 0, [])
     try:
-        await ctx.send("View Reviews By:", view=view)
+        await ctx.send(screen.content, view=screen.view)
     except Exception as e:
-        logging.error(f'Error sending ratings view: {e}')
+        logging.error('Error sending ratings view: %s', e)
 
 @client.command()
 async def recommendations(ctx):
-    logging.info(f'Received request to show recommendations')
-    view = RecommendationsStartView(db=db)
+    logging.info('Received request to show recommendations')
+    screen = SCREENS['recommendations'](db, ctx.guild, '', 0, [])
     try:
-        await ctx.send("View Recommendations By:", view=view)
+        await ctx.send(screen.content, view=screen.view)
     except Exception as e:
-        logging.error(f'Error sending recommendations view: {e}')
+        logging.error('Error sending recommendations view: %s', e)
+
+# Slash commands. Autocomplete is answered from search_index and never touches SQLite,
+# so it comfortably fits in Discord's 3 second window. A value too long for a choice (100
+# characters) is sent as a key, CHOICE_KEY_MARKER and a hash of the value, which the command
+# looks up in the same index. Nobody can type the marker, so typed text is always taken as it is.
+CHOICE_LIMIT = 100
+CHOICE_KEY_MARKER = '\x1f'
+
+
+def _choice_key(value):
+    return CHOICE_KEY_MARKER + hashlib.blake2b(value.encode(), digest_size=16).hexdigest()
+
+
+def _choices(values, guild):
+    return [app_commands.Choice(name=display_name(value, guild)[:CHOICE_LIMIT],
+                                value=value if len(value) <= CHOICE_LIMIT else _choice_key(value))
+            for value in values]
+
+
+def _suggest(interaction, current, field):
+    if interaction.guild is None:
+        return []
+    if not startup.ready:
+        # The indexes are still warming up. Offer what was typed so the command still works.
+        if not current or len(current) > CHOICE_LIMIT:
+            return []
+        return [app_commands.Choice(name=f'{current} (suggestions are still loading)'[:CHOICE_LIMIT], value=current)]
+    index = getattr(search_index.for_guild(interaction.guild_id), field)
+    return _choices(index.complete(current), interaction.guild)
+
+
+def _chosen(interaction, value, field):
+    """The value a command was given: as typed, or the long value a _choice_key stands for (None if it's gone)."""
+    if not value or not value.startswith(CHOICE_KEY_MARKER):
+        return value
+    index = getattr(search_index.for_guild(interaction.guild_id), field)
+    return next((v for v in index.values if len(v) > CHOICE_LIMIT and _choice_key(v) == value), None)
+
+
+@client.tree.command(name='rating', description='Show the ratings for a track')
+@app_commands.describe(track='Track name')
+async def rating_command(interaction: discord.Interaction, track: str):
+    logging.info('Received /rating for %s', track)
+    await send_results(interaction, db, 'track_name', _chosen(interaction, track, 'tracks'))
+
+
+@rating_command.autocomplete('track')
+async def rating_track_autocomplete(interaction: discord.Interaction, current: str):
+    return _suggest(interaction, current, 'tracks')
+
+
+@client.tree.command(name='reviews', description='Show the reviews of songs someone recommended')
+@app_commands.describe(by='Who recommended the songs')
+async def reviews_command(interaction: discord.Interaction, by: str):
+    logging.info('Received /reviews for %s', by)
+    await send_results(interaction, db, 'recommended_by', _chosen(interaction, by, 'recommenders'))
+
+
+@reviews_command.autocomplete('by')
+async def reviews_by_autocomplete(interaction: discord.Interaction, current: str):
+    return _suggest(interaction, current, 'recommenders')
+
+
+@client.tree.command(name='recs', description='Show recommendations by genre and/or tag')
+@app_commands.describe(genre='Genre', tag='Tag')
+async def recs_command(interaction: discord.Interaction, genre: str = None, tag: str = None):
+    logging.info('Received /recs for genre %s, tag %s', genre, tag)
+    if not genre and not tag:
+        await interaction.response.send_message("Pick a genre, a tag or both.", ephemeral=True)
+        return
+    await send_results(interaction, db, 'recs', _chosen(interaction, genre or '', 'genres'),
+                       _chosen(interaction, tag or '', 'tags'))
+
+
+@recs_command.autocomplete('genre')
+async def recs_genre_autocomplete(interaction: discord.Interaction, current: str):
+    return _suggest(interaction, current, 'genres')
+
+
+@recs_command.autocomplete('tag')
+async def recs_tag_autocomplete(interaction: discord.Interaction, current: str):
+    return _suggest(interaction, current, 'tags')
+
+
+async def setup_hook():
+    # One dispatcher for every menu button ever sent, see views/menu.py
+    client.add_dynamic_items(MenuButton)
+    with startup.phase('slash command sync'):
+        synced = await client.tree.sync()
+    logging.info('Synced %s slash commands', len(synced))
+
+client.setup_hook = setup_hook
 
 @client.event
 async def on_message(message):
+    if recorder:
+        settings = ingestor.settings_for(message)
+        if settings and getattr(message.channel, 'name', None) in (settings.track_list_channel, settings.music_review_channel):
+            recorder.record(message)
     await client.process_commands(message)
-    await process_message(message)
+    if INGEST_MODE == 'worker':
+        route = ingestor.route(message)
+        if route:
+            # Journaled here, with the payload from the gateway, so it's retried even if the worker can't fetch it
+            ingestor.journal(message, route)
+            jobs.enqueue('message', message.channel.id, message.id)
+    else:
+        await ingestor.process_message(message)
 
 
 # @client.event
@@ -429,9 +653,15 @@ async def on_message(message):
 #                 logging.error(f'Error inserting recommendation on edit: {e}')
 
 
-try:
-    logging.info('Bot Is Running.')
-    client.run(
-        os.getenv('DISCORD_TOKEN', 'PUT YOUR TOKEN IN THE ENV FILE YOU DUMB IDIOT DUMMY'))
-except discord.LoginFailure as e:
-    logging.error(f'Bot Login Failure: {e}')
+if __name__ == '__main__':
+    try:
+        logging.info('Bot Is Running. Setup took %s', startup.summary())
+        startup.begin('login and gateway')
+        client.run(
+            os.getenv('DISCORD_TOKEN', 'PUT YOUR TOKEN IN THE ENV FILE YOU DUMB IDIOT DUMMY'),
+            log_handler=None)
+    except discord.LoginFailure as e:
+        logging.error('Bot Login Failure: %s', e)
+    finally:
+        if recorder:
+            recorder.close()
@@ -1,17 +1,168 @@
 import sqlite3
+from db.models import RatingRow, RecommendationRow, GuildSettings
+
+RATING_COLUMNS = 'id, guild_id, message_id, recommended_by, track_name, link, rating, review, timestamp, created_at'
+RECOMMENDATION_COLUMNS = 'id, guild_id, message_id, title, author, link, genre1, genre2, tag, timestamp, created_at'
+GUILD_SETTINGS_COLUMNS = 'guild_id, track_list_channel, music_review_channel, controlling_user'
+
+# Discord ids are snowflakes: milliseconds since the Discord epoch (2015-01-01) shifted left
+# by 22 bits. Album ratings are stored as "<message_id>-<index>", so strip the suffix first.
+SNOWFLAKE_EPOCH_SQL = '''
+    ((CAST(CASE WHEN instr(message_id, '-') > 0
+                THEN substr(message_id, 1, instr(message_id, '-') - 1)
+                ELSE message_id END AS INTEGER) >> 22) + 1420070400000) / 1000
+'''
+
+
+def _add_column(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    return False
+
+
+def _create_indexes(cursor, indexes):
+    for name, table, columns in indexes:
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+
+# Schema migrations, applied in order. Databases from before user_version was tracked are at
+# version 0 whatever their schema, so the first three check before changing anything.
+# Append new migrations to the end and never edit one that has shipped.
+
+def _create_archive(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recommendations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE NOT NULL,
+            title TEXT,
+            author TEXT,
+            link TEXT,
+            genre1 TEXT,
+            genre2 TEXT,
+            tag TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER UNIQUE NOT NULL,
+            recommended_by TEXT,
+            track_name TEXT,
+            link TEXT,
+            rating INTEGER,
+            review TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _add_guilds(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id INTEGER PRIMARY KEY,
+            track_list_channel TEXT,
+            music_review_channel TEXT,
+            controlling_user TEXT
+        )
+    ''')
+    # Rows archived before multi-guild support have guild_id 0 until a guild claims them
+    _add_column(cursor, 'recommendations', 'guild_id', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(cursor, 'ratings', 'guild_id', 'INTEGER NOT NULL DEFAULT 0')
+    # Every query filters by guild first, so one guild's volume doesn't slow down another's
+    _create_indexes(cursor, (
+        ('idx_recommendations_guild_tag', 'recommendations', 'guild_id, tag'),
+        ('idx_recommendations_guild_genre1', 'recommendations', 'guild_id, genre1'),
+        ('idx_recommendations_guild_genre2', 'recommendations', 'guild_id, genre2'),
+        ('idx_ratings_guild_rating', 'ratings', 'guild_id, rating'),
+        ('idx_ratings_guild_recommended_by', 'ratings', 'guild_id, recommended_by'),
+        ('idx_ratings_guild_track_name', 'ratings', 'guild_id, track_name')))
+
+
+def _add_created_at(cursor):
+    # timestamp is when the row was archived, created_at when the message was posted
+    for table in ('recommendations', 'ratings'):
+        if _add_column(cursor, table, 'created_at', 'INTEGER'):
+            cursor.execute(f'UPDATE {table} SET created_at = {SNOWFLAKE_EPOCH_SQL} WHERE created_at IS NULL')
+    _create_indexes(cursor, (
+        ('idx_recommendations_guild_created_at', 'recommendations', 'guild_id, created_at'),
+        ('idx_ratings_guild_created_at', 'ratings', 'guild_id, created_at')))
+
+
+def _add_ingest_journal(cursor):
+    # Every message the ingestor routes is written here before it's processed, so one that
+    # fails (no embed yet, Spotify down, fetch errors) can be retried without a full backfill
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER UNIQUE NOT NULL,
+            route TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            next_attempt_at INTEGER,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+    ''')
+    _create_indexes(cursor, (
+        ('idx_ingest_journal_status_next_attempt', 'ingest_journal', 'status, next_attempt_at'),
+        ('idx_ingest_journal_status_updated_at', 'ingest_journal', 'status, updated_at'),
+        ('idx_ingest_journal_guild_status', 'ingest_journal', 'guild_id, status, updated_at')))
+
+
+def _drop_ingest_journal(cursor):
+    # The journal moved to its own file (db/journal.py). Entries left here are only for
+    # messages that failed, and a backfill of their channel picks those up again.
+    cursor.execute('DROP TABLE IF EXISTS ingest_journal')
+
+
+MIGRATIONS = [
+    _create_archive,
+    _add_guilds,
+    _add_created_at,
+    _add_ingest_journal,
+    _drop_ingest_journal,
+]
+
 
 class DBConnector:
-    def __init__(self, db_path):
+    def __init__(self, db_path, read_only=False):
         self.db_path = db_path
+        self.read_only = read_only
         self.connection = None
+        self.writes = 0  # Bumped by every write through this connector
 
     def connect(self):
         """Establish a connection to the SQLite database."""
         if self.connection is None:
-            self.connection = sqlite3.connect(self.db_path)
+            # Shared with the backup thread, which SQLite serializes for us
+            if self.read_only:
+                self.connection = sqlite3.connect(f'file:{self.db_path}?mode=ro', uri=True, check_same_thread=False)
+            else:
+                self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+                self.connection.execute('PRAGMA journal_mode=WAL')
             self.connection.row_factory = sqlite3.Row
         return self.connection
 
+    def data_version(self):
+        """Changes whenever another connection commits, e.g. the ingest worker."""
+        return self.connect().execute('PRAGMA data_version').fetchone()[0]
+
+    def write_version(self):
+        """
+        Changes whenever the archive does. A writable connector is the only writer, so counting
+        its own writes is enough. A read-only one also has to ask SQLite about other processes.
+        """
+        if self.read_only:
+            return self.writes, self.data_version()
+        return self.writes
+
     def close(self):
         """Close the database connection."""
         if self.connection:
@@ -19,106 +170,267 @@ class DBConnector:
             self.connection = None
 
     def create_tables(self):
-        """Create tables for recommendations and ratings if they don't exist."""
+        """
+        Brings the schema up to date. PRAGMA user_version records how many of MIGRATIONS have
+        been applied, so starting on a current database is a single pragma read. Each migration
+        runs in its own transaction. Returns the number applied.
+        """
+        conn = self.connect()
+        applied = 0
+        while conn.execute('PRAGMA user_version').fetchone()[0] < len(MIGRATIONS):
+            # The bot and the worker both migrate at startup. IMMEDIATE takes the write lock
+            # before the version is read again, so only one of them applies each migration.
+            conn.execute('BEGIN IMMEDIATE')
+            with conn:
+                version = conn.execute('PRAGMA user_version').fetchone()[0]
+                if version < len(MIGRATIONS):
+                    MIGRATIONS[version](conn.cursor())
+                    conn.execute(f'PRAGMA user_version = {version + 1}')
+                    applied += 1
+        return applied
+
+    def get_guild_settings(self, guild_id):
         conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS recommendations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id INTEGER UNIQUE NOT NULL,
-                title TEXT,
-                author TEXT,
-                link TEXT,
-                genre1 TEXT,
-                genre2 TEXT,
-                tag TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
+        cursor.execute(f'''
+            SELECT {GUILD_SETTINGS_COLUMNS} FROM guild_settings WHERE guild_id = ?
+        ''', (guild_id,))
+        row = cursor.fetchone()
+        return GuildSettings(*row) if row else None
+
+    def get_all_guild_settings(self):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {GUILD_SETTINGS_COLUMNS} FROM guild_settings
         ''')
+        return [GuildSettings(*row) for row in cursor.fetchall()]
+
+    def save_guild_settings(self, settings):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            INSERT OR REPLACE INTO guild_settings ({GUILD_SETTINGS_COLUMNS}) VALUES (?, ?, ?, ?)
+        ''', (settings.guild_id, settings.track_list_channel, settings.music_review_channel,
+              settings.controlling_user.lower()))
+        conn.commit()
+
+    def claim_legacy_rows(self, guild_id):
+        """Assigns rows archived before multi-guild support to guild_id. Returns the number claimed."""
+        conn = self.connect()
+        with conn:
+            claimed = conn.execute('UPDATE recommendations SET guild_id = ? WHERE guild_id = 0', (guild_id,)).rowcount
+            claimed += conn.execute('UPDATE ratings SET guild_id = ? WHERE guild_id = 0', (guild_id,)).rowcount
+        self.writes += 1
+        return claimed
+
+    def get_guild_ids(self):
+        conn = self.connect()
+        cursor = conn.cursor()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ratings (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                message_id INTEGER UNIQUE NOT NULL,
-                recommended_by TEXT,
-                track_name TEXT,
-                link TEXT,
-                rating INTEGER,
-                review TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
+            SELECT guild_id FROM guild_settings
+            UNION SELECT DISTINCT guild_id FROM recommendations
+            UNION SELECT DISTINCT guild_id FROM ratings
         ''')
-        conn.commit()
+        return [row['guild_id'] for row in cursor.fetchall()]
 
-    def insert_recommendation(self, message_id, author, title, link, genres, tag):
+    def insert_recommendation(self, rec):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO recommendations (message_id, title, author, link, genre1, genre2, tag)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (message_id, title, author, link, str(genres[0]), str(genres[1]), tag))
+            INSERT INTO recommendations (guild_id, message_id, created_at, title, author, link, genre1, genre2, tag)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (rec.guild_id, rec.message_id, rec.created_at, rec.title, rec.author, rec.link, rec.genre1, rec.genre2, rec.tag))
         conn.commit()
+        self.writes += 1
 
-    def insert_rating(self, message_id, recommended_by, track_name, link, rating, review):
+    def insert_rating(self, rating):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO ratings (message_id, recommended_by, track_name, link, rating, review)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (message_id, recommended_by, track_name, link, rating, review))
+            INSERT INTO ratings (guild_id, message_id, created_at, recommended_by, track_name, link, rating, review)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (rating.guild_id, rating.message_id, rating.created_at, rating.recommended_by, rating.track_name, rating.link, rating.rating, rating.review))
         conn.commit()
-    
-    def get_all_recommended_by(self):
+        self.writes += 1
+
+    def insert_recommendations(self, recs):
+        """Insert a batch of recommendations in one transaction, skipping ones already archived. Returns the number inserted."""
+        conn = self.connect()
+        with conn:
+            cursor = conn.executemany('''
+                INSERT OR IGNORE INTO recommendations (guild_id, message_id, created_at, title, author, link, genre1, genre2, tag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(r.guild_id, r.message_id, r.created_at, r.title, r.author, r.link, r.genre1, r.genre2, r.tag) for r in recs])
+        self.writes += 1
+        return cursor.rowcount
+
+    def insert_ratings(self, ratings):
+        """Insert a batch of ratings in one transaction, skipping ones already archived. Returns the number inserted."""
+        conn = self.connect()
+        with conn:
+            cursor = conn.executemany('''
+                INSERT OR IGNORE INTO ratings (guild_id, message_id, created_at, recommended_by, track_name, link, rating, review)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(r.guild_id, r.message_id, r.created_at, r.recommended_by, r.track_name, r.link, r.rating, r.review) for r in ratings])
+        self.writes += 1
+        return cursor.rowcount
+
+    def insert_batch(self, recs, ratings):
+        """Insert recommendations and ratings in one transaction, skipping ones already archived. Returns the number inserted."""
+        conn = self.connect()
+        with conn:
+            inserted = conn.executemany('''
+                INSERT OR IGNORE INTO recommendations (guild_id, message_id, created_at, title, author, link, genre1, genre2, tag)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(r.guild_id, r.message_id, r.created_at, r.title, r.author, r.link, r.genre1, r.genre2, r.tag) for r in recs]).rowcount
+            inserted += conn.executemany('''
+                INSERT OR IGNORE INTO ratings (guild_id, message_id, created_at, recommended_by, track_name, link, rating, review)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', [(r.guild_id, r.message_id, r.created_at, r.recommended_by, r.track_name, r.link, r.rating, r.review) for r in ratings]).rowcount
+        if inserted:
+            self.writes += 1
+        return inserted
+
+    def get_all_recommended_by(self, guild_id):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT DISTINCT recommended_by FROM ratings
-        ''')
+            SELECT DISTINCT recommended_by FROM ratings WHERE guild_id = ?
+        ''', (guild_id,))
         return [row['recommended_by'] for row in cursor.fetchall()]
 
-    def get_tracks_by_rating(self, rating):
+    def get_all_track_names(self, guild_id):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT * FROM ratings WHERE rating = ?
-        ''', (rating,))
-        return cursor.fetchall()
-    
-    def get_tracks_by_recommended_by(self, recommended_by):
+            SELECT DISTINCT track_name FROM ratings WHERE guild_id = ?
+        ''', (guild_id,))
+        return [row['track_name'] for row in cursor.fetchall()]
+
+    def get_tracks_by_track_name(self, guild_id, track_name):
         conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM ratings WHERE recommended_by = ?
-        ''', (recommended_by,))
-        return cursor.fetchall()
-    
-    def get_recommendations_by_genre(self, genre):
+        cursor.execute(f'''
+            SELECT {RATING_COLUMNS} FROM ratings WHERE guild_id = ? AND track_name = ?
+        ''', (guild_id, track_name))
+        return [RatingRow(*row) for row in cursor.fetchall()]
+
+    def get_tracks_by_rating(self, guild_id, rating):
         conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM recommendations WHERE genre = ?
-        ''', (genre,))
-        return cursor.fetchall()
+        cursor.execute(f'''
+            SELECT {RATING_COLUMNS} FROM ratings WHERE guild_id = ? AND rating = ?
+        ''', (guild_id, rating))
+        return [RatingRow(*row) for row in cursor.fetchall()]
 
-    def get_recommendations_by_tag(self, tag):
+    def get_tracks_by_recommended_by(self, guild_id, recommended_by):
         conn = self.connect()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM recommendations WHERE tag = ?
-        ''', (tag,))
-        return cursor.fetchall()
-    
-    def get_all_genres(self):
+        cursor.execute(f'''
+            SELECT {RATING_COLUMNS} FROM ratings WHERE guild_id = ? AND recommended_by = ?
+        ''', (guild_id, recommended_by))
+        return [RatingRow(*row) for row in cursor.fetchall()]
+
+    def get_recommendations_by_genre(self, guild_id, genre):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RECOMMENDATION_COLUMNS} FROM recommendations
+            WHERE guild_id = ? AND (genre1 = ? OR genre2 = ?)
+        ''', (guild_id, genre, genre))
+        return [RecommendationRow(*row) for row in cursor.fetchall()]
+
+    def get_recommendations_by_tag(self, guild_id, tag):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RECOMMENDATION_COLUMNS} FROM recommendations WHERE guild_id = ? AND tag = ?
+        ''', (guild_id, tag))
+        return [RecommendationRow(*row) for row in cursor.fetchall()]
+
+    def get_ratings_between(self, guild_id, start, end=None, limit=None):
+        """Ratings posted in [start, end) epoch seconds, newest first. No end means up to now."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RATING_COLUMNS} FROM ratings
+            WHERE guild_id = ? AND created_at >= ? AND created_at < ?
+            ORDER BY created_at DESC LIMIT ?
+        ''', (guild_id, start, end if end is not None else 2 ** 62, limit if limit is not None else -1))
+        return [RatingRow(*row) for row in cursor.fetchall()]
+
+    def get_recommendations_between(self, guild_id, start, end=None, limit=None):
+        """Recommendations posted in [start, end) epoch seconds, newest first. No end means up to now."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RECOMMENDATION_COLUMNS} FROM recommendations
+            WHERE guild_id = ? AND created_at >= ? AND created_at < ?
+            ORDER BY created_at DESC LIMIT ?
+        ''', (guild_id, start, end if end is not None else 2 ** 62, limit if limit is not None else -1))
+        return [RecommendationRow(*row) for row in cursor.fetchall()]
+
+    def find_value(self, guild_id, table, column, value):
+        """The id of a row in table with this value in column, or None. Menus use it to refer to long values."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT id FROM {table} WHERE guild_id = ? AND {column} = ? LIMIT 1
+        ''', (guild_id, value))
+        row = cursor.fetchone()
+        return row['id'] if row else None
+
+    def get_value(self, table, column, row_id):
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {column} FROM {table} WHERE id = ?
+        ''', (row_id,))
+        row = cursor.fetchone()
+        return row[column] if row else None
+
+    def get_all_genres(self, guild_id):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT DISTINCT genre FROM recommendations
-        ''')
+            SELECT genre1 AS genre FROM recommendations WHERE guild_id = ? AND genre1 != ''
+            UNION
+            SELECT genre2 FROM recommendations WHERE guild_id = ? AND genre2 != ''
+        ''', (guild_id, guild_id))
         return [row['genre'] for row in cursor.fetchall()]
 
-    def get_all_tags(self):
+    def get_all_tags(self, guild_id):
         conn = self.connect()
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT DISTINCT tag FROM recommendations
+            SELECT DISTINCT tag FROM recommendations WHERE guild_id = ?
+        ''', (guild_id,))
+        return [row['tag'] for row in cursor.fetchall()]
+
+    def get_max_ids(self):
+        """The highest rating and recommendation ids, 0 when a table is empty."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT (SELECT COALESCE(MAX(id), 0) FROM ratings), (SELECT COALESCE(MAX(id), 0) FROM recommendations)
         ''')
-        return [row['tag'] for row in cursor.fetchall()]
\ No newline at end of file
+        return tuple(cursor.fetchone())
+
+    def get_ratings_after(self, row_id):
+        """Ratings in every guild archived after the rating with this id, oldest first."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RATING_COLUMNS} FROM ratings WHERE id > ? ORDER BY id
+        ''', (row_id,))
+        return [RatingRow(*row) for row in cursor.fetchall()]
+
+    def get_recommendations_after(self, row_id):
+        """Recommendations in every guild archived after the one with this id, oldest first."""
+        conn = self.connect()
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {RECOMMENDATION_COLUMNS} FROM recommendations WHERE id > ? ORDER BY id
+        ''', (row_id,))
+        return [RecommendationRow(*row) for row in cursor.fetchall()]
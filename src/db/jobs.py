@@ -0,0 +1,91 @@
+import sqlite3
+from db.models import Job
+
+JOB_COLUMNS = 'id, kind, channel_id, message_id, status, processed, duplicates, skipped, result, created_at, updated_at'
+
+
+class JobQueue:
+    """
+    SQLite-backed job table shared by the bot and the ingest worker when they run as
+    separate processes. It lives in its own file so the bot can keep the archive read-only.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        return self.connection
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def create_tables(self):
+        conn = self.connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                channel_id INTEGER,
+                message_id INTEGER,
+                status TEXT NOT NULL DEFAULT 'queued',
+                processed INTEGER NOT NULL DEFAULT 0,
+                duplicates INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingest_jobs_status ON ingest_jobs (status, kind, id)
+        ''')
+
+    def enqueue(self, kind, channel_id, message_id=None):
+        cursor = self.connect().execute('''
+            INSERT INTO ingest_jobs (kind, channel_id, message_id) VALUES (?, ?, ?)
+        ''', (kind, channel_id, message_id))
+        return cursor.lastrowid
+
+    def claim_next(self, kinds):
+        """Marks the oldest queued job of one of `kinds` as running and returns it, or None."""
+        placeholders = ', '.join('?' for _ in kinds)
+        row = self.connect().execute(f'''
+            UPDATE ingest_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM ingest_jobs WHERE status = 'queued' AND kind IN ({placeholders})
+                ORDER BY id LIMIT 1
+            )
+            RETURNING {JOB_COLUMNS}
+        ''', tuple(kinds)).fetchone()
+        return Job(*row) if row else None
+
+    def requeue_running(self):
+        """Puts back jobs left running by a worker that died."""
+        cursor = self.connect().execute('''
+            UPDATE ingest_jobs SET status = 'queued', updated_at = CURRENT_TIMESTAMP WHERE status = 'running'
+        ''')
+        return cursor.rowcount
+
+    def update_progress(self, job_id, stats):
+        self.connect().execute('''
+            UPDATE ingest_jobs SET processed = ?, duplicates = ?, skipped = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (stats.processed, stats.duplicates, stats.skipped, job_id))
+
+    def finish(self, job_id, status, result=None):
+        self.connect().execute('''
+            UPDATE ingest_jobs SET status = ?, result = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (status, result, job_id))
+
+    def get(self, job_id):
+        row = self.connect().execute(f'''
+            SELECT {JOB_COLUMNS} FROM ingest_jobs WHERE id = ?
+        ''', (job_id,)).fetchone()
+        return Job(*row) if row else None
@@ -0,0 +1,128 @@
+import sqlite3
+from db.models import JournalEntry
+
+JOURNAL_COLUMNS = ('id, guild_id, channel_id, message_id, route, payload, status, attempts, last_error, '
+                   'next_attempt_at, created_at, updated_at')
+
+
+class IngestJournal:
+    """
+    Every message the ingestor routes is written here before it's processed, so one that
+    fails (no embed yet, Spotify down, fetch errors) can be retried without a full backfill.
+    It lives in its own file, like the job queue: journaling every message would otherwise
+    count as an archive write, and the bot drops its cached result pages after each of those.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None,
+                                              check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        return self.connection
+
+    def close(self):
+        if self.connection:
+            self.connection.close()
+            self.connection = None
+
+    def create_tables(self):
+        conn = self.connect()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS ingest_journal (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER UNIQUE NOT NULL,
+                route TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at INTEGER,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingest_journal_status_next_attempt ON ingest_journal (status, next_attempt_at)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingest_journal_status_updated_at ON ingest_journal (status, updated_at)
+        ''')
+        conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ingest_journal_guild_status ON ingest_journal (guild_id, status, updated_at)
+        ''')
+
+    def record(self, guild_id, channel_id, message_id, route, payload, now):
+        """
+        Records a message as pending before it's processed. A message seen again, e.g. by a
+        backfill, is reset to pending with its new payload but keeps its attempt count.
+        """
+        self.connect().execute('''
+            INSERT INTO ingest_journal (guild_id, channel_id, message_id, route, payload, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (message_id) DO UPDATE SET
+                payload = excluded.payload, status = 'pending', updated_at = excluded.updated_at
+        ''', (guild_id, channel_id, message_id, route, payload, now, now))
+
+    def finish(self, outcomes, now):
+        """
+        Records how processing went, in one transaction. outcomes are (message_id, status,
+        last_error, next_attempt_at); each one counts as an attempt, except 'done'.
+        """
+        conn = self.connect()
+        conn.execute('BEGIN')
+        with conn:
+            conn.executemany('''
+                UPDATE ingest_journal
+                SET status = ?, last_error = ?, next_attempt_at = ?, updated_at = ?,
+                    attempts = attempts + (? != 'done')
+                WHERE message_id = ?
+            ''', [(status, error, next_attempt_at, now, status, message_id)
+                  for message_id, status, error, next_attempt_at in outcomes])
+
+    def get_retryable(self, now, stale_before, limit):
+        """
+        Failed entries that are due, plus pending ones last touched before stale_before, which
+        were interrupted, e.g. by a restart. Oldest first.
+        """
+        rows = self.connect().execute(f'''
+            SELECT {JOURNAL_COLUMNS} FROM ingest_journal
+            WHERE (status = 'failed' AND next_attempt_at <= ?) OR (status = 'pending' AND updated_at < ?)
+            ORDER BY id LIMIT ?
+        ''', (now, stale_before, limit)).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def count(self, guild_id):
+        """Entries by status for one guild."""
+        rows = self.connect().execute('''
+            SELECT status, COUNT(*) AS count FROM ingest_journal WHERE guild_id = ? GROUP BY status
+        ''', (guild_id,)).fetchall()
+        return {row['status']: row['count'] for row in rows}
+
+    def get_failures(self, guild_id, limit=10):
+        """Failed and then abandoned entries for one guild, most recently attempted first."""
+        rows = self.connect().execute(f'''
+            SELECT {JOURNAL_COLUMNS} FROM ingest_journal
+            WHERE guild_id = ? AND status IN ('failed', 'abandoned')
+            ORDER BY status = 'abandoned', updated_at DESC, id DESC LIMIT ?
+        ''', (guild_id, limit)).fetchall()
+        return [JournalEntry(*row) for row in rows]
+
+    def requeue_failures(self, guild_id, now):
+        """Makes a guild's failed and abandoned entries due now with a fresh attempt count. Returns how many."""
+        return self.connect().execute('''
+            UPDATE ingest_journal SET status = 'failed', attempts = 0, next_attempt_at = ?, updated_at = ?
+            WHERE guild_id = ? AND status IN ('failed', 'abandoned')
+        ''', (now, now, guild_id)).rowcount
+
+    def prune(self, before):
+        """Deletes entries that were archived before this epoch second. Returns how many."""
+        return self.connect().execute('''
+            DELETE FROM ingest_journal WHERE status = 'done' AND updated_at < ?
+        ''', (before,)).rowcount
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+
+# Slotted records passed between the parsers, the DB layer and the views.
+# They are much smaller than discord.py Messages or sqlite3.Rows, so the
+# backfill converts each message into one of these as soon as it is read.
+
+
+@dataclass(slots=True)
+class ParsedEmbed:
+    title: str
+    author: str
+    link: str
+
+
+@dataclass(slots=True)
+class ParsedRecommendation:
+    guild_id: int
+    message_id: int
+    created_at: int  # When the message was posted, epoch seconds
+    author: str
+    title: str
+    link: str
+    genre1: str
+    genre2: str
+    tag: str
+
+
+@dataclass(slots=True)
+class ParsedRating:
+    guild_id: int
+    # Album reviews store one rating per track as "<message_id>-<index>"
+    message_id: int | str
+    created_at: int
+    recommended_by: str
+    track_name: str
+    link: str
+    rating: str
+    review: str
+    author: str  # Artist, only used for the confirmation embed
+
+
+@dataclass(slots=True)
+class RatingRow:
+    id: int
+    guild_id: int
+    message_id: int | str
+    recommended_by: str
+    track_name: str
+    link: str
+    rating: int
+    review: str
+    timestamp: str  # When the row was archived
+    created_at: int  # When the message was posted, epoch seconds
+
+
+@dataclass(slots=True)
+class RecommendationRow:
+    id: int
+    guild_id: int
+    message_id: int
+    title: str
+    author: str
+    link: str
+    genre1: str
+    genre2: str
+    tag: str
+    timestamp: str
+    created_at: int
+
+
+@dataclass(slots=True)
+class GuildSettings:
+    guild_id: int
+    track_list_channel: str
+    music_review_channel: str
+    controlling_user: str
+
+
+@dataclass(slots=True)
+class BackfillStats:
+    processed: int = 0  # New records inserted
+    duplicates: int = 0  # Records that were already archived
+    skipped: int = 0  # Messages that were not ours or could not be parsed
+
+
+@dataclass(slots=True)
+class Job:
+    id: int
+    kind: str  # 'message', 'backfill' or 'backup'
+    channel_id: int
+    message_id: int | None
+    status: str  # 'queued', 'running', 'done', 'skipped' or 'failed'
+    processed: int
+    duplicates: int
+    skipped: int
+    result: str | None
+    created_at: str
+    updated_at: str
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'skipped', 'failed')
+
+
+@dataclass(slots=True)
+class JournalEntry:
+    id: int
+    guild_id: int
+    channel_id: int
+    message_id: int
+    route: str  # 'track_list' or 'music_review'
+    payload: str  # serialize_message() as JSON, written before processing
+    status: str  # pending, done, failed (will be retried) or abandoned
+    attempts: int
+    last_error: str | None
+    next_attempt_at: int | None  # Epoch seconds
+    created_at: int
+    updated_at: int
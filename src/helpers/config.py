@@ -0,0 +1,21 @@
+import json
+import os
+from dotenv import load_dotenv
+
+
+def load_config():
+    """Returns (environment, db_path, settings) for the current ENVIRONMENT."""
+    # Load environment variables - don't forget to configure .env for production
+    if os.path.exists('.env'):
+        load_dotenv()
+        environment = os.getenv('ENVIRONMENT', 'development')
+    else:
+        environment = os.environ.get('ENVIRONMENT', 'development')
+
+    if environment == 'production':
+        db_path = 'db/rutta-dj-prod.sqlite3'
+        settings = json.load(open('config/prod.json'))
+    else:
+        db_path = 'db/rutta-dj-dev.sqlite3'
+        settings = json.load(open('config/dev.json'))
+    return environment, db_path, settings
@@ -0,0 +1,111 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+import time
+from collections import Counter
+
+# Attributes every LogRecord has. Anything else was passed through extra= and goes into the JSON output.
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, including any extra= fields."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops a share of high volume INFO/DEBUG records by their `event` extra field.
+    sample_rates maps event -> fraction kept, rate_limits maps event -> records per second.
+    Warnings and errors always pass.
+    """
+
+    def __init__(self, sample_rates=None, rate_limits=None):
+        super().__init__()
+        self.sample_rates = sample_rates or {}
+        self.rate_limits = rate_limits or {}
+        self.buckets = {}
+        self.dropped = Counter()
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, 'event', None)
+        if event is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.sample_rates.get(event)
+        if rate is not None and random.random() >= rate:
+            self.dropped[event] += 1
+            return False
+        limit = self.rate_limits.get(event)
+        if limit and not self._take_token(event, limit):
+            self.dropped[event] += 1
+            return False
+        return True
+
+    def _take_token(self, event, limit):
+        # Token bucket holding up to one second's worth of records
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.get(event, (limit, now))
+            tokens = min(limit, tokens + (now - last) * limit)
+            if tokens < 1:
+                self.buckets[event] = (tokens, now)
+                return False
+            self.buckets[event] = (tokens - 1, now)
+            return True
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that hands the record over untouched. The stock prepare() formats the
+    message on the calling thread; here %-formatting happens on the listener thread instead.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def setup_logging(level=logging.INFO, log_format='json', sample_rates=None, rate_limits=None):
+    """
+    Routes all logging through a queue so callers never block on stream I/O.
+    Returns the running QueueListener, which is stopped automatically at exit.
+    """
+    if log_format == 'json':
+        formatter = JSONFormatter(datefmt='%Y-%m-%d %H:%M:%S')
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s',
+                                      datefmt='%Y-%m-%d %H:%M:%S')
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates, rate_limits))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
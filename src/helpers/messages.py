@@ -1,5 +1,6 @@
 import re
 import logging
+from db.models import ParsedEmbed
 
 def extract_link(text):
     match = re.search(r'(https?://\S+)', text)
@@ -19,7 +20,7 @@ def parse_rating(text):
         if reviewI is not None and reviewI < len(lines):
             explanation = '\n'.join(lines[reviewI:]).strip()
     except Exception as e:
-        logging.error(f'Error parsing rating: {e}')
+        logging.error('Error parsing rating: %s', e)
         rating, explanation = None, None
     return rating, explanation
 
@@ -31,7 +32,7 @@ def parse_recommendation(text):
         tag = parts[-1].strip()
         genre = "-".join(parts[0:-1]).strip()
     except Exception as e:
-        logging.error(f'Error parsing recommendation: {e}')
+        logging.error('Error parsing recommendation: %s', e)
         genre, tag = None, None
     return genre, tag
 
@@ -44,7 +45,7 @@ def parse_embed(embed):
             author = author.rstrip(' - Topic')
         link = embed.url if hasattr(embed, 'url') else None
     except Exception as e:
-        logging.error(f'Error parsing embed: {e}')
+        logging.error('Error parsing embed: %s', e, extra={'event': 'parse_failed'})
         title, author, link = None, None, None
-    return title, author, link
+    return ParsedEmbed(title, author, link)
     
@@ -0,0 +1,56 @@
+from collections import OrderedDict
+
+
+class PageCache:
+    """
+    LRU cache of rendered pages and the query results they're cut from. Every entry is
+    stamped with the version it was built at, and a lookup with a different version is a
+    miss, so a write anywhere invalidates everything without having to know which pages it
+    touched.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (version, value)
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # Misses because the entry was built before the last write
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, version):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] != version:
+            del self.entries[key]
+            self.misses += 1
+            self.stale += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, version, value):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = (version, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def summary(self):
+        return (f'{len(self.entries)}/{self.max_entries} entries cached, hit rate {self.hit_rate:.1%} '
+                f'({self.hits} hits, {self.misses} misses, {self.stale} stale, {self.evictions} evicted)')
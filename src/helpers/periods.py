@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta, timezone
+
+# Browse periods offered by the views, in button order
+PERIODS = {
+    'week': 'This Week',
+    'month': 'This Month',
+    'year': 'This Year',
+}
+
+
+def period_start(period, now=None):
+    """Epoch seconds at the start of the current calendar week (Monday), month or year, in UTC."""
+    now = now or datetime.now(timezone.utc)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == 'week':
+        start = midnight - timedelta(days=midnight.weekday())
+    elif period == 'month':
+        start = midnight.replace(day=1)
+    elif period == 'year':
+        start = midnight.replace(month=1, day=1)
+    else:
+        raise ValueError(f'Unknown period {period}')
+    return int(start.timestamp())
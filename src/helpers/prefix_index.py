@@ -0,0 +1,159 @@
+from bisect import bisect_left, insort
+
+
+class PrefixIndex:
+    """
+    Case-insensitive prefix lookup over a set of strings, kept as one sorted list.
+    Every word start is indexed, so "beat" finds "The Beatles" as well as "Beat It".
+    """
+
+    def __init__(self, values=()):
+        self.entries = []  # (casefolded suffix, value), sorted
+        self.ordered = []  # (casefolded value, value), sorted, for empty prefixes
+        self.values = set()
+        self.update(values)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, value):
+        return value in self.values
+
+    @staticmethod
+    def _suffixes(value):
+        folded = value.casefold()
+        yield folded
+        for i, char in enumerate(folded):
+            if char == ' ' and i + 1 < len(folded) and folded[i + 1] != ' ':
+                yield folded[i + 1:]
+
+    def add(self, value):
+        if not value or value in self.values:
+            return
+        self.values.add(value)
+        insort(self.ordered, (value.casefold(), value))
+        for suffix in self._suffixes(value):
+            insort(self.entries, (suffix, value))
+
+    def update(self, values):
+        """Adds many values at once, sorting once instead of per insert."""
+        new = {value for value in values if value and value not in self.values}
+        self.values |= new
+        self.ordered.extend((value.casefold(), value) for value in new)
+        self.ordered.sort()
+        self.entries.extend((suffix, value) for value in new for suffix in self._suffixes(value))
+        self.entries.sort()
+
+    def complete(self, prefix, limit=25):
+        """Returns up to `limit` values with a word starting with `prefix`, best matches first."""
+        key = prefix.casefold().strip()
+        if not key:
+            return [value for _, value in self.ordered[:limit]]
+        results = []
+        seen = set()
+        i = bisect_left(self.entries, (key, ''))
+        while i < len(self.entries) and len(results) < limit:
+            suffix, value = self.entries[i]
+            if not suffix.startswith(key):
+                break
+            if value not in seen:
+                seen.add(value)
+                results.append(value)
+            i += 1
+        # Values that start with the prefix read better than mid-name matches
+        results.sort(key=lambda v: not v.casefold().startswith(key))
+        return results
+
+
+class SearchIndexes:
+    """Prefix indexes for one guild backing slash command autocomplete, so it never has to touch SQLite."""
+
+    def __init__(self):
+        self.tracks = PrefixIndex()
+        self.recommenders = PrefixIndex()
+        self.genres = PrefixIndex()
+        self.tags = PrefixIndex()
+
+    @classmethod
+    def build(cls, db, guild_id):
+        indexes = cls()
+        indexes.tracks.update(db.get_all_track_names(guild_id))
+        indexes.recommenders.update(db.get_all_recommended_by(guild_id))
+        indexes.genres.update(db.get_all_genres(guild_id))
+        indexes.tags.update(db.get_all_tags(guild_id))
+        return indexes
+
+    def update(self, ratings=(), recommendations=()):
+        """Adds many archived rows at once, see PrefixIndex.update."""
+        self.tracks.update(rating.track_name for rating in ratings)
+        self.recommenders.update(rating.recommended_by for rating in ratings)
+        self.genres.update(genre for rec in recommendations for genre in (rec.genre1, rec.genre2))
+        self.tags.update(rec.tag for rec in recommendations)
+
+    def add_recommendation(self, rec):
+        self.genres.add(rec.genre1)
+        self.genres.add(rec.genre2)
+        self.tags.add(rec.tag)
+
+    def add_rating(self, rating):
+        self.tracks.add(rating.track_name)
+        self.recommenders.add(rating.recommended_by)
+
+
+class GuildSearchIndexes:
+    """SearchIndexes per guild, so suggestions never leak between communities."""
+
+    def __init__(self):
+        self.guilds = {}
+        # The newest archive rows indexed so far, so catching up only reads rows after them
+        self.last_rating_id = 0
+        self.last_recommendation_id = 0
+
+    @classmethod
+    def build(cls, db):
+        indexes = cls()
+        # Read first: a row archived during the build is then read again by the next catch up,
+        # which is harmless, rather than missed
+        indexes.last_rating_id, indexes.last_recommendation_id = db.get_max_ids()
+        for guild_id in db.get_guild_ids():
+            indexes.guilds[guild_id] = SearchIndexes.build(db, guild_id)
+        return indexes
+
+    def adopt(self, other):
+        """
+        Takes over the indexes and watermarks of one built elsewhere, e.g. on a thread, so
+        everything holding this instance sees them.
+        """
+        self.guilds = other.guilds
+        self.last_rating_id = other.last_rating_id
+        self.last_recommendation_id = other.last_recommendation_id
+
+    def for_guild(self, guild_id):
+        if guild_id not in self.guilds:
+            self.guilds[guild_id] = SearchIndexes()
+        return self.guilds[guild_id]
+
+    def add_recommendation(self, rec):
+        self.for_guild(rec.guild_id).add_recommendation(rec)
+
+    def add_rating(self, rating):
+        self.for_guild(rating.guild_id).add_rating(rating)
+
+    def read_new_rows(self, db):
+        """Rows archived since the build or the last catch_up, as (ratings, recommendations)."""
+        return db.get_ratings_after(self.last_rating_id), db.get_recommendations_after(self.last_recommendation_id)
+
+    def catch_up(self, ratings, recommendations):
+        """Adds rows from read_new_rows to the indexes of the guilds they belong to, and only those."""
+        by_guild = {}
+        for rating in ratings:
+            by_guild.setdefault(rating.guild_id, ([], []))[0].append(rating)
+        for rec in recommendations:
+            by_guild.setdefault(rec.guild_id, ([], []))[1].append(rec)
+        for guild_id, (guild_ratings, guild_recs) in by_guild.items():
+            self.for_guild(guild_id).update(guild_ratings, guild_recs)
+        if ratings:
+            self.last_rating_id = max(self.last_rating_id, ratings[-1].id)
+        if recommendations:
+            self.last_recommendation_id = max(self.last_recommendation_id, recommendations[-1].id)
+        return len(by_guild)
@@ -0,0 +1,104 @@
+import gzip
+import json
+import logging
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import discord
+
+
+def serialize_message(message):
+    """
+    Converts a discord.py Message into a plain dict holding only the fields
+    process_message looks at, so it can be written out and replayed later.
+    """
+    reference = None
+    if message.reference:
+        reference = {
+            'message_id': message.reference.message_id,
+            'channel_id': message.reference.channel_id,
+        }
+        # Discord usually resolves the replied-to message for us. Keep it so the
+        # replayer can answer fetch_message without a live connection.
+        resolved = getattr(message.reference, 'resolved', None)
+        if resolved is not None and hasattr(resolved, 'embeds'):
+            reference['resolved'] = serialize_message(resolved)
+
+    return {
+        'id': message.id,
+        'content': message.content,
+        'created_at': message.created_at.isoformat(),
+        'author': {
+            'id': message.author.id,
+            'name': message.author.name,
+            'global_name': message.author.global_name,
+        },
+        'channel': {
+            'id': message.channel.id,
+            'name': getattr(message.channel, 'name', None),
+        },
+        'guild_id': message.guild.id if message.guild else None,
+        'embeds': [embed.to_dict() for embed in message.embeds],
+        'reference': reference,
+    }
+
+
+class RecordedMessage:
+    """
+    A message rebuilt from serialize_message's dict, with the fields the parsers read. The
+    ingestor parses journaled payloads with it when a message can't be fetched again.
+    """
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.content = data.get('content', '')
+        self.created_at = datetime.fromisoformat(data['created_at'])
+        self.author = SimpleNamespace(**data.get('author', {}))
+        self.channel = SimpleNamespace(**data.get('channel', {}))
+        self.guild = SimpleNamespace(id=data['guild_id']) if data.get('guild_id') else None
+        self.embeds = [discord.Embed.from_dict(e) for e in data.get('embeds', [])]
+        reference = data.get('reference')
+        self.reference = SimpleNamespace(message_id=reference.get('message_id'),
+                                         channel_id=reference.get('channel_id')) if reference else None
+        # The replied-to message, if Discord had resolved it when this one was recorded
+        resolved = (reference or {}).get('resolved')
+        self.replied_message = RecordedMessage(resolved) if resolved else None
+
+
+def read_events(path):
+    """Yields recorded events from a (optionally gzip compressed) JSONL file."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class EventRecorder:
+    """Appends on_message payloads to a compressed JSONL file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.count = 0
+
+    def open(self):
+        if self.file is None:
+            opener = gzip.open if self.path.endswith('.gz') else open
+            self.file = opener(self.path, 'at', encoding='utf-8')
+        return self.file
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def record(self, message):
+        try:
+            event = {'received_at': time.time(), 'message': serialize_message(message)}
+            self.open().write(json.dumps(event, separators=(',', ':')) + '\n')
+            self.count += 1
+        except Exception as e:
+            logging.error('Error recording message %s: %s', message.id, e)
@@ -1,23 +1,29 @@
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
 import re
 from dotenv import load_dotenv
 import os
 import logging
 
-# Load environment variables from .env file
-if os.path.exists('.env'):
-    load_dotenv()
-    CLIENT_ID = os.getenv('SPOTIFY_CLIENT_ID', 'your_client_id_here')
-    CLIENT_SECRET = os.getenv('SPOTIFY_CLIENT_SECRET', 'your_client_secret_here')
-else:
-    CLIENT_ID = os.environ.get('SPOTIFY_CLIENT_ID', 'your_client_id_here')
-    CLIENT_SECRET = os.environ.get('SPOTIFY_CLIENT_SECRET', 'your_client_secret_here')
+_sp = None
 
 
-# Authenticate with Spotify API
-sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(client_id=CLIENT_ID,
-                                                           client_secret=CLIENT_SECRET))
+def get_spotify():
+    """
+    The Spotify client, created on first use. Importing spotipy and building the auth
+    manager is slow, and most starts never look up an artist before they're needed.
+    """
+    global _sp
+    if _sp is None:
+        import spotipy
+        from spotipy.oauth2 import SpotifyClientCredentials
+        # Load environment variables from .env file
+        if os.path.exists('.env'):
+            load_dotenv()
+        # Authenticate with Spotify API
+        _sp = spotipy.Spotify(auth_manager=SpotifyClientCredentials(
+            client_id=os.getenv('SPOTIFY_CLIENT_ID', 'your_client_id_here'),
+            client_secret=os.getenv('SPOTIFY_CLIENT_SECRET', 'your_client_secret_here')))
+    return _sp
+
 
 def get_artist_from_spotify_link(spotify_link):
     """
@@ -26,12 +32,14 @@ def get_artist_from_spotify_link(spotify_link):
     # Extract the Spotify ID and type from the link
     match = re.search(r'spotify\.com/(track|album)/([a-zA-Z0-9]+)', spotify_link)
     if not match:
-        logging.error(f'Invalid Spotify link: {spotify_link}')
+        logging.error('Invalid Spotify link: %s', spotify_link, extra={'event': 'spotify_failed'})
         return None
     
     item_type = match.group(1)
     item_id = match.group(2)
 
+    sp = get_spotify()
+    from spotipy.exceptions import SpotifyException
     try:
         if item_type == 'track':
             track_info = sp.track(item_id)
@@ -42,8 +50,50 @@ def get_artist_from_spotify_link(spotify_link):
             artists = [artist['name'] for artist in album_info['artists']]
             return ", ".join(artists)
         else: 
-            logging.error(f'Unsupported Spotify item type: {item_type}')
+            logging.error('Unsupported Spotify item type: %s', item_type, extra={'event': 'spotify_failed'})
             return None
-    except spotipy.exceptions.SpotifyException as e:
-        logging.error(f'Spotify API error: {e}')
-        return None
\ No newline at end of file
+    except SpotifyException as e:
+        logging.error('Spotify API error: %s', e, extra={'event': 'spotify_failed'})
+        return None
+
+# Most ids the Spotify API takes in one several-tracks / several-albums request
+SPOTIFY_BATCH_LIMITS = {'track': 50, 'album': 20}
+
+
+def get_artists_from_spotify_links(spotify_links):
+    """
+    Looks up the artists for many Spotify links with one request per 50 tracks or 20 albums
+    instead of one per link. Returns {link: "Artist, Artist"}, leaving out links it couldn't resolve.
+    """
+    ids = {'track': {}, 'album': {}}  # type -> {id: [links]}
+    for link in spotify_links:
+        match = re.search(r'spotify\.com/(track|album)/([a-zA-Z0-9]+)', link or '')
+        if not match:
+            logging.error('Invalid Spotify link: %s', link, extra={'event': 'spotify_failed'})
+            continue
+        ids[match.group(1)].setdefault(match.group(2), []).append(link)
+    if not ids['track'] and not ids['album']:
+        return {}
+
+    sp = get_spotify()
+    from spotipy.exceptions import SpotifyException
+    artists = {}
+    for item_type, links_by_id in ids.items():
+        item_ids = list(links_by_id)
+        limit = SPOTIFY_BATCH_LIMITS[item_type]
+        for start in range(0, len(item_ids), limit):
+            chunk = item_ids[start:start + limit]
+            try:
+                if item_type == 'track':
+                    items = sp.tracks(chunk)['tracks']
+                else:
+                    items = sp.albums(chunk)['albums']
+            except SpotifyException as e:
+                logging.error('Spotify API error: %s', e, extra={'event': 'spotify_failed'})
+                continue
+            # Unknown ids come back as None in their place
+            for item_id, item in zip(chunk, items):
+                if item:
+                    for link in links_by_id[item_id]:
+                        artists[link] = ", ".join(artist['name'] for artist in item['artists'])
+    return artists
@@ -0,0 +1,40 @@
+import logging
+import time
+from contextlib import contextmanager
+
+
+class Startup:
+    """
+    Times each phase of startup and tracks readiness. Until the background warm-up
+    finishes, ready is False and commands that need warm state say so instead of waiting.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = []  # (name, seconds) in the order they finished
+        self.open = {}
+        self.ready = False
+
+    def begin(self, name):
+        self.open[name] = time.perf_counter()
+
+    def end(self, name):
+        started = self.open.pop(name, None)
+        if started is not None:
+            self.phases.append((name, time.perf_counter() - started))
+
+    @contextmanager
+    def phase(self, name):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def mark_ready(self):
+        self.ready = True
+        logging.info('Startup complete: %s', self.summary())
+
+    def summary(self):
+        phases = ', '.join(f'{name} {seconds * 1000:.0f}ms' for name, seconds in self.phases)
+        return f'{phases}; {time.perf_counter() - self.started:.2f}s total'
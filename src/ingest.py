@@ -0,0 +1,537 @@
+import asyncio
+import discord
+import json
+import re
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from db.models import ParsedRecommendation, ParsedRating, BackfillStats
+from helpers.messages import parse_embed
+from helpers.recorder import serialize_message, RecordedMessage
+from helpers.spotify import get_artist_from_spotify_link, get_artists_from_spotify_links
+
+# Failed messages are retried after RETRY_BASE_SECONDS, doubling each attempt up to
+# RETRY_MAX_SECONDS, and abandoned after RETRY_MAX_ATTEMPTS.
+RETRY_BASE_SECONDS = 60
+RETRY_MAX_SECONDS = 6 * 60 * 60
+RETRY_MAX_ATTEMPTS = 8
+# A journal entry still pending after this long was interrupted, e.g. by a restart
+STALE_PENDING_SECONDS = 10 * 60
+
+#WARNING CURSED REGEX HIDE YOUR EYES I'M SO SORRY
+# Matches "Title - Rating\nExplanation" or "Rating\nExplanation", once per track of an album review
+REVIEW_PATTERN = r"(?:^|\n)(?:(.+?)\s*-\s*)?(\d+(?:\.\d+)?)\n(.+?)(?=\n(?:.+?\s*-\s*)?\d+(?:\.\d+)?\n|$)"
+
+
+class Ingestor:
+    """
+    Parses messages from each guild's track list and music review channels and archives them.
+    Shared by the bot, the ingest worker and the replay tools.
+    """
+
+    def __init__(self, db, client, search_index=None, artist_lookup=get_artist_from_spotify_link, batch_size=500,
+                 artists_lookup=get_artists_from_spotify_links, retry_batch_size=50, ingest_journal=None):
+        self.db = db
+        self.ingest_journal = ingest_journal  # IngestJournal, or None to archive without journaling
+        self.client = client
+        self.search_index = search_index
+        self.artist_lookup = artist_lookup  # link -> artists, one Spotify request each
+        self.artists_lookup = artists_lookup  # links -> {link: artists}, batched for retries
+        self.batch_size = batch_size
+        self.retry_batch_size = retry_batch_size
+        self.guild_settings = {}  # guild_id -> GuildSettings, or None if not set up
+
+    def create_rating_embed(self, title, author, link, rating, explanation):
+        try:
+            embed = discord.Embed(title=f'Rating for {title}',
+                                  description=explanation)
+            embed.set_thumbnail(url=self.client.user.display_avatar.url)
+            embed.add_field(name='Author', value=author, inline=True)
+            embed.add_field(name='Link', value=link, inline=True)
+            embed.add_field(name='Rating', value=rating, inline=True)
+            embed.set_footer(text='Rutta DJ Bot')
+        except Exception as e:
+            logging.error('Error creating rating embed: %s', e)
+            embed = discord.Embed(title='Error',
+                                  description='Failed to create rating embed.')
+            embed.set_thumbnail(url=self.client.user.display_avatar.url)
+            embed.set_footer(text='Rutta DJ Bot')
+        return embed
+
+    def create_recommendation_embed(self, title, author, link, genre, tag):
+        try:
+            embed = discord.Embed(title=f'Recommendation: {title}',
+                                  description=f'Genre: {genre}\nTag: {tag}')
+            embed.set_thumbnail(url=self.client.user.display_avatar.url)
+            embed.add_field(name='Author', value=author, inline=True)
+            embed.add_field(name='Link', value=link, inline=True)
+            embed.set_footer(text='Rutta DJ Bot')
+        except Exception as e:
+            logging.error('Error creating recommendation embed: %s', e)
+            embed = discord.Embed(
+                title='Error',
+                description='Failed to create recommendation embed.')
+            embed.set_thumbnail(url=self.client.user.display_avatar.url)
+            embed.set_footer(text='Rutta DJ Bot')
+        return embed
+
+    async def confirm(self, message, embed):
+        """Sends a confirmation embed. The records are archived by then, so failing to send is only logged."""
+        try:
+            await message.channel.send(embed=embed)
+        except Exception as e:
+            logging.error('Error sending confirmation: %s', e, extra={'event': 'confirm_failed', 'message_id': message.id})
+
+    def settings_for(self, message):
+        """
+        Returns the GuildSettings for the message's guild, or None for DMs and guilds that aren't
+        set up. Every message the bot sees comes through here, so they're cached until forget_settings.
+        """
+        if message.guild is None:
+            return None
+        guild_id = message.guild.id
+        if guild_id not in self.guild_settings:
+            self.guild_settings[guild_id] = self.db.get_guild_settings(guild_id)
+        return self.guild_settings[guild_id]
+
+    def forget_settings(self, guild_id=None):
+        """Drops the cached settings for a guild, or every guild, after they were saved."""
+        if guild_id is None:
+            self.guild_settings.clear()
+        else:
+            self.guild_settings.pop(guild_id, None)
+
+    def route(self, message):
+        """
+        Returns 'track_list' or 'music_review' if the message was posted by its guild's controlling
+        user in one of the guild's configured channels, otherwise None.
+        """
+        settings = self.settings_for(message)
+        if settings is None or str(message.author.global_name).lower() != settings.controlling_user:
+            return None
+        name = getattr(message.channel, 'name', None)
+        if name == settings.track_list_channel:
+            return 'track_list'
+        elif name == settings.music_review_channel:
+            return 'music_review'
+        return None
+
+    async def parse_message(self, message):
+        """
+        Turns a message from one of the tracked channels into ParsedRecommendation / ParsedRating records.
+        Returns None for messages we don't archive or can't parse.
+        """
+        return await self.parse_routed_message(message, self.route(message))
+
+    async def parse_routed_message(self, message, route, replied_message=None, artist_lookup=None):
+        if route == 'track_list':
+            rec = await self.parse_track_list_message(message, artist_lookup)
+            return [rec] if rec else None
+        elif route == 'music_review':
+            return await self.parse_music_review_message(message, replied_message, artist_lookup)
+        return None
+
+    async def process_message(self, message, wait_for_embed=True):
+        """
+        Archives a message from one of the tracked channels. It's written to the ingest journal
+        first, so if it can't be archived now retry_failed picks it up later. wait_for_embed=False
+        skips the pause for a fresh message's embed, for callers that already waited and refetched.
+        """
+        route = self.route(message)
+        if route is None:
+            return False
+        self.journal(message, route)
+        if route == 'track_list':
+            ok = await self.process_track_list_message(message, wait_for_embed)
+        else:
+            ok = await self.process_music_review_message(message)
+        self.finish_journal(message.id, None if ok else self.failure(message, route))
+        return ok
+
+    def format_error(self, message, route):
+        """
+        Why the message can never be parsed, e.g. a review that isn't a reply, or None if it's
+        in the expected format and failed for a reason a retry could fix (no embed yet, Spotify).
+        """
+        lines = message.content.strip().split('\n')
+        if route == 'track_list':
+            if len(lines) < 2:
+                return 'Not in the "Genre - Tag" and link format'
+            if len(lines[0].strip().split('-')) < 2:
+                return 'The first line is not "Genre - Tag"'
+        elif route == 'music_review':
+            if not message.reference:
+                return 'Not a reply to a recommendation'
+            if not re.findall(REVIEW_PATTERN, message.content):
+                return 'No "Rating" and review lines found'
+        return None
+
+    def failure(self, message, route):
+        """(error, retry) for a message that couldn't be archived."""
+        error = self.format_error(message, route)
+        if error:
+            return error, False
+        return 'Could not be parsed or archived, see the logs for this message', True
+
+    def journal(self, message, route):
+        if self.ingest_journal is None:
+            return
+        try:
+            self.ingest_journal.record(message.guild.id, message.channel.id, message.id, route,
+                                   json.dumps(serialize_message(message)), int(time.time()))
+        except Exception as e:
+            # Still archive the message, it just won't be retried if this attempt fails
+            logging.error('Error journaling message: %s', e, extra={'event': 'journal_failed', 'message_id': message.id})
+
+    def finish_journal(self, message_id, failure=None):
+        """Records the outcome: archived if failure is None, else (error, retry) as from failure()."""
+        if self.ingest_journal is None:
+            return
+        now = int(time.time())
+        if failure is None:
+            outcome = (message_id, 'done', None, None)
+        else:
+            error, retry = failure
+            # Messages that can never be parsed aren't retried, so they don't bury real failures
+            outcome = (message_id, 'failed', error, now + retry_delay(1)) if retry else (message_id, 'abandoned', error, None)
+        try:
+            self.ingest_journal.finish([outcome], now)
+        except Exception as e:
+            logging.error('Error journaling message: %s', e, extra={'event': 'journal_failed', 'message_id': message_id})
+
+    async def lookup_artist(self, link, artist_lookup=None):
+        """
+        The artists for a link whose embed didn't name them. artist_lookup is a prefetched
+        lookup, e.g. a retry batch's; otherwise Spotify is asked on a thread, since spotipy
+        blocks, and backs off and retries while Spotify is down.
+        """
+        if artist_lookup is not None:
+            return artist_lookup(link)
+        return await asyncio.to_thread(self.artist_lookup, link)
+
+    async def parse_track_list_message(self, message, artist_lookup=None):
+        # Expecting format:
+        # Genre - Tag\nhttps://www.youtube.com/watch?v=4hz68I4BRMA
+        # OR:
+        # @Genre[s] - Tag\nhttps://www.youtube.com/watch?v=4hz68I4BRMA
+        try:
+            text = message.content.strip()
+            lines = text.split('\n')
+            if len(lines) < 2:
+                logging.error('Invalid format in message: %s', text, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+
+            genre_tag_line = lines[0].strip().split('-')
+            if len(genre_tag_line) < 2:
+                logging.error('Invalid genre-tag format in message: %s', text, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            genres = re.findall(r'<@&\d+>', genre_tag_line[0])
+            if not genres:
+                genres = genre_tag_line[0].strip().split(' ')
+            if len(genres) < 2:
+                genres.append('')  # Ensure we have at least two genres
+            tag = genre_tag_line[-1].strip()
+
+            if message.embeds:
+                parsed = parse_embed(message.embeds[0])
+            else:
+                logging.error('Message %s does not contain an embed.', message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            if not parsed.title:
+                logging.error('Missing title in replied message: %s', message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            if not parsed.link:
+                logging.error('Missing link in replied message: %s', message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            author = parsed.author or await self.lookup_artist(parsed.link, artist_lookup)
+            if not author:
+                logging.error('Missing author in replied message: %s', message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+
+            return ParsedRecommendation(message.guild.id, message.id, int(message.created_at.timestamp()), author, parsed.title, parsed.link, str(genres[0]), str(genres[1]), tag)
+        except Exception as e:
+            logging.error('Error parsing track list message: %s', e, extra={'event': 'parse_failed', 'message_id': message.id})
+            return None
+
+    async def process_track_list_message(self, message, wait_for_embed=True):
+        logging.info('Received message from %s in %s: %s', message.author.global_name, message.channel.name, message.content,
+                     extra={'event': 'message_received', 'message_id': message.id})
+        if wait_for_embed and (message.created_at + timedelta(seconds = 60) > datetime.now(timezone.utc)): await asyncio.sleep(5) #Pray the embed is generated :)
+        try:
+            rec = await self.parse_track_list_message(message)
+            if not rec:
+                return False
+
+            self.db.insert_recommendation(rec)
+            if self.search_index:
+                self.search_index.add_recommendation(rec)
+            logging.info('Recommendation inserted: %s by %s (%s) with genres %s %s and tag %s', rec.title, rec.author, rec.link, rec.genre1, rec.genre2, rec.tag,
+                         extra={'event': 'recommendation_inserted', 'message_id': rec.message_id})
+            curr_time = datetime.now(timezone.utc)
+            diff = curr_time - message.created_at
+            if diff.total_seconds() < 360:
+                embed = self.create_recommendation_embed(rec.title, rec.author, rec.link, f'{rec.genre1} {rec.genre2}', rec.tag)
+                await self.confirm(message, embed)
+            return True
+
+        except Exception as e:
+            logging.error('Error processing track list message: %s', e, extra={'event': 'ingest_failed', 'message_id': message.id})
+            return False
+
+    async def parse_music_review_message(self, message, replied_message=None, artist_lookup=None):
+        # If Rutta is rating a track, he should be replying to a message with the song link
+        # This assumes that the embed is in the replied message and has already been generated. Might break if embed isn't generated or there's a lot of lag
+        if not message.reference:
+            logging.error('Message %s is not a reply to a recommendation.', message.id, extra={'event': 'parse_failed', 'message_id': message.id})
+            return None
+
+        try:
+            #look for the replied message and embed and parse it if present
+            if replied_message is None:
+                replied_message = await message.channel.fetch_message(message.reference.message_id)
+            if not replied_message.embeds:
+                logging.error('Replied message %s does not contain an embed.', replied_message.id, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            parsed = parse_embed(replied_message.embeds[0])
+            if not parsed.title:
+                logging.error('Missing title in replied message: %s', replied_message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            if not parsed.link:
+                logging.error('Missing link in replied message: %s', replied_message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            author = parsed.author or await self.lookup_artist(parsed.link, artist_lookup)
+            if not author:
+                logging.error('Missing author in replied message: %s', replied_message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                return None
+            recommended_by = replied_message.author.global_name
+
+            # Check if we're looking at an album or a track
+            # Review format expected:
+
+            # Title - Rating\nExplanation
+            # Example: "Track Name - 5\nThis track is amazing!"
+
+            # OR
+
+            # Rating\nExplanation
+            # Example: "5\nThis track is amazing!"
+            # use re to find all ratings and explanations, if findall returns more than one and the title contains album or discography, assume it's an album review
+            # This regex matches: optional title, rating, and explanation
+            # Example: "Track Title - 5\nExplanation" or "5\nExplanation"
+
+            tracks_to_process = re.findall(REVIEW_PATTERN, message.content)
+            if 'album' in parsed.title.lower() or 'discography' in parsed.title.lower() or len(tracks_to_process) > 1:
+                logging.info('Processing album recommendation: %s', parsed.title, extra={'event': 'album_detected', 'message_id': message.id})
+            ratings = []
+            for idx, track in enumerate(tracks_to_process):
+                track_name, rating, explanation = track
+                if not track_name:
+                    track_name = parsed.title
+                if not rating or not explanation:
+                    logging.error('Missing rating or explanation in message: %s', message.content, extra={'event': 'parse_failed', 'message_id': message.id})
+                    return None
+                #If it's an album the title might start with Track 1 - track_name or Track 1: track_name. We want to strip the Track [Integer] -  or Track [Integer]: part
+                track_name = re.sub(r'^Track \d+ - |^Track \d+: ', '', track_name.strip())
+                unique_id = f"{message.id}-{idx}" if len(tracks_to_process) > 1 else message.id
+                ratings.append(ParsedRating(message.guild.id, unique_id, int(message.created_at.timestamp()), recommended_by, track_name, parsed.link, rating, explanation, author))
+            return ratings
+        except Exception as e:
+            logging.error('Error parsing music review message: %s', e, extra={'event': 'parse_failed', 'message_id': message.id})
+            return None
+
+    async def process_music_review_message(self, message):
+        try:
+            ratings = await self.parse_music_review_message(message)
+            if ratings is None:
+                return False
+            for rating in ratings:
+                self.db.insert_rating(rating)
+                if self.search_index:
+                    self.search_index.add_rating(rating)
+                logging.info('Rating inserted: %s by %s (%s) with rating %s and explanation "%s"', rating.track_name, rating.author, rating.link, rating.rating, rating.review,
+                             extra={'event': 'rating_inserted', 'message_id': rating.message_id})
+                curr_time = datetime.now(timezone.utc)
+                diff = curr_time - message.created_at
+                if diff.total_seconds() < 360:
+                    embed = self.create_rating_embed(rating.track_name, rating.author, rating.link, rating.rating, rating.review)
+                    await self.confirm(message, embed)
+            return True
+        except Exception as e:
+            logging.error('Error processing music review message: %s', e, extra={'event': 'ingest_failed', 'message_id': message.id})
+            return False
+
+    async def backfill(self, channels, on_progress=None):
+        """
+        Archives the history of the given channels. Each message is turned into slotted
+        records straight away so the Message itself can be freed, and records are written
+        in batches of batch_size. on_progress, if given, is awaited with the running
+        BackfillStats after every batch.
+        """
+        stats = BackfillStats()
+        pending_recs, pending_ratings = [], []
+
+        async def flush():
+            pending = len(pending_recs) + len(pending_ratings)
+            inserted = 0
+            if self.search_index:
+                for rec in pending_recs:
+                    self.search_index.add_recommendation(rec)
+                for rating in pending_ratings:
+                    self.search_index.add_rating(rating)
+            if pending_recs:
+                inserted += self.db.insert_recommendations(pending_recs)
+            if pending_ratings:
+                inserted += self.db.insert_ratings(pending_ratings)
+            stats.processed += inserted
+            stats.duplicates += pending - inserted
+            pending_recs.clear()
+            pending_ratings.clear()
+            if on_progress:
+                await on_progress(stats)
+
+        for channel in channels:
+            logging.info('Starting historical processing in %s', channel)
+            async for message in channel.history(limit=100000, oldest_first=True):
+                route = self.route(message)
+                records = await self.parse_routed_message(message, route)
+                if not records:
+                    stats.skipped += 1
+                    if route:
+                        # Ours but unparseable, leave it for retry_failed rather than the next backfill
+                        self.journal(message, route)
+                        self.finish_journal(message.id, self.failure(message, route))
+                    continue
+                for record in records:
+                    if isinstance(record, ParsedRecommendation):
+                        pending_recs.append(record)
+                    else:
+                        pending_ratings.append(record)
+                if len(pending_recs) + len(pending_ratings) >= self.batch_size:
+                    await flush()
+            await flush()
+            logging.info('Processed %s records, skipped %s messages.', stats.processed, stats.skipped)
+        return stats
+
+    async def retry_failed(self):
+        """
+        Retries one batch of failed ingest journal entries that are due. Each message is fetched
+        again, since the usual cause is an embed that hadn't arrived. If that fails, e.g. it was
+        deleted or Discord is down, its journaled payload is parsed instead. Artists missing from
+        embeds are looked up in one batched Spotify call. The recovered records are archived in
+        one transaction, then every entry's outcome in another; if we stop in between, the
+        entries are still pending and their records are skipped as duplicates next time. No
+        confirmation embeds are sent, the messages are old by now. Returns (recovered, failed,
+        abandoned), or None if nothing was due.
+        """
+        if self.ingest_journal is None:
+            return None
+        now = int(time.time())
+        entries = self.ingest_journal.get_retryable(now, now - STALE_PENDING_SECONDS, self.retry_batch_size)
+        if not entries:
+            return None
+        outcomes = {}
+        fetch_errors = {}  # Outcomes for messages that couldn't be fetched, if their payload doesn't parse either
+        fetched = []
+        for entry in entries:
+            try:
+                channel = self.client.get_channel(entry.channel_id) or await self.client.fetch_channel(entry.channel_id)
+                message = await channel.fetch_message(entry.message_id)
+                replied = None
+                if entry.route == 'music_review' and message.reference:
+                    replied = await channel.fetch_message(message.reference.message_id)
+                fetched.append((entry, message, replied))
+                continue
+            except (discord.NotFound, discord.Forbidden) as e:
+                # Deleted, or we lost access to the channel: fetching again won't help
+                fetch_errors[entry.message_id] = ('abandoned', f'Could not fetch the message: {e}')
+            except Exception as e:
+                fetch_errors[entry.message_id] = ('failed', f'Could not fetch the message: {e}')
+            recorded = recorded_message(entry)
+            # A review can only be parsed with the message it replied to, which Discord usually resolved
+            if recorded is not None and (entry.route != 'music_review' or recorded.replied_message is not None):
+                fetched.append((entry, recorded, recorded.replied_message))
+            else:
+                outcomes[entry.message_id] = fetch_errors[entry.message_id]
+
+        links = set()
+        for entry, message, replied in fetched:
+            embed_message = replied if entry.route == 'music_review' else message
+            if embed_message is not None and embed_message.embeds:
+                parsed = parse_embed(embed_message.embeds[0])
+                if parsed.link and not parsed.author:
+                    links.add(parsed.link)
+        try:
+            # spotipy blocks, and backs off and retries while Spotify is down, so keep it off the event loop
+            artists = await asyncio.to_thread(self.artists_lookup, sorted(links)) if links else {}
+        except Exception as e:
+            logging.error('Error looking up artists: %s', e, extra={'event': 'spotify_failed'})
+            artists = {}
+
+        recs, ratings = [], []
+        for entry, message, replied in fetched:
+            records = await self.parse_routed_message(message, entry.route, replied, artists.get)
+            if not records:
+                error = self.format_error(message, entry.route)
+                if error:
+                    outcomes[entry.message_id] = ('abandoned', error)
+                else:
+                    outcomes[entry.message_id] = fetch_errors.get(entry.message_id) or \
+                        ('failed', 'Could not be parsed, see the logs for this message')
+                continue
+            outcomes[entry.message_id] = ('done', None)
+            for record in records:
+                if isinstance(record, ParsedRecommendation):
+                    recs.append(record)
+                else:
+                    ratings.append(record)
+
+        rows = []
+        counts = {'done': 0, 'failed': 0, 'abandoned': 0}
+        for entry in entries:
+            status, error = outcomes[entry.message_id]
+            if status == 'failed' and entry.attempts + 1 >= RETRY_MAX_ATTEMPTS:
+                status = 'abandoned'
+            counts[status] += 1
+            next_attempt_at = now + retry_delay(entry.attempts + 1) if status == 'failed' else None
+            rows.append((entry.message_id, status, error, next_attempt_at))
+        if recs or ratings:
+            self.db.insert_batch(recs, ratings)
+        self.ingest_journal.finish(rows, now)
+        if self.search_index:
+            for rec in recs:
+                self.search_index.add_recommendation(rec)
+            for rating in ratings:
+                self.search_index.add_rating(rating)
+        logging.info('Retried %s journal entries: %s recovered, %s failed, %s abandoned', len(entries),
+                     counts['done'], counts['failed'], counts['abandoned'], extra={'event': 'journal_retried'})
+        return counts['done'], counts['failed'], counts['abandoned']
+
+    async def retry_journal(self, keep_days=30):
+        """
+        Retries batches until nothing more is due, then deletes archived entries older than
+        keep_days. The bot and the worker call this on a timer.
+        """
+        while True:
+            result = await self.retry_failed()
+            if result is None or sum(result) < self.retry_batch_size:
+                break
+            # Give live messages and Discord's rate limits room between full batches
+            await asyncio.sleep(1)
+        if keep_days and self.ingest_journal is not None:
+            pruned = self.ingest_journal.prune(int(time.time()) - keep_days * 86400)
+            if pruned:
+                logging.info('Pruned %s archived journal entries', pruned, extra={'event': 'journal_pruned'})
+
+
+def recorded_message(entry):
+    """A journal entry's message as it was when it was journaled, or None if the payload can't be read."""
+    try:
+        return RecordedMessage(json.loads(entry.payload))
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        logging.error('Error reading journaled payload: %s', e, extra={'event': 'journal_failed', 'message_id': entry.message_id})
+        return None
+
+
+def retry_delay(failures):
+    """Seconds to wait before retrying an entry that has failed this many times."""
+    return min(RETRY_BASE_SECONDS * 2 ** (failures - 1), RETRY_MAX_SECONDS)
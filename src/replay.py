@@ -0,0 +1,216 @@
+"""
+Replays recorded on_message payloads through process_message without a Discord connection.
+
+Record a session by starting the bot with RECORD_EVENTS=events.jsonl.gz, then:
+
+    python ./src/replay.py events.jsonl.gz --speed 100 --db db/replay.sqlite3
+
+--speed 1 replays at the recorded pace, --speed N replays N times faster and
+--speed 0 feeds messages in as fast as the event loop allows.
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+from datetime import datetime
+
+import discord
+
+from db.db_connector import DBConnector
+from db.journal import IngestJournal
+from db.models import GuildSettings
+from helpers.config import load_config
+from helpers.prefix_index import GuildSearchIndexes
+from helpers.recorder import read_events
+from ingest import Ingestor
+
+
+class ReplayAuthor:
+
+    def __init__(self, data):
+        self.id = data.get('id')
+        self.name = data.get('name')
+        self.global_name = data.get('global_name')
+
+
+class ReplayReference:
+
+    def __init__(self, data):
+        self.message_id = data.get('message_id')
+        self.channel_id = data.get('channel_id')
+
+
+class ReplayGuild:
+
+    def __init__(self, guild_id):
+        self.id = guild_id
+
+
+class ReplayChannel:
+    """Stands in for a TextChannel. send() is counted, fetch_message() reads from the recording."""
+
+    def __init__(self, data, harness):
+        self.id = data.get('id')
+        self.name = data.get('name')
+        self.harness = harness
+
+    async def send(self, *args, **kwargs):
+        self.harness.sends += 1
+        if self.harness.send_latency:
+            await asyncio.sleep(self.harness.send_latency)
+
+    async def fetch_message(self, message_id):
+        self.harness.fetches += 1
+        if self.harness.fetch_latency:
+            await asyncio.sleep(self.harness.fetch_latency)
+        message = self.harness.messages.get(message_id)
+        if message is None:
+            raise LookupError(f'Message {message_id} not in recording')
+        return message
+
+
+class ReplayMessage:
+
+    def __init__(self, data, harness):
+        self.id = data['id']
+        self.content = data.get('content', '')
+        self.created_at = datetime.fromisoformat(data['created_at'])
+        self.author = ReplayAuthor(data.get('author', {}))
+        self.channel = harness.channel(data.get('channel', {}))
+        self.guild = ReplayGuild(data['guild_id']) if data.get('guild_id') else None
+        self.embeds = [discord.Embed.from_dict(e) for e in data.get('embeds', [])]
+        reference = data.get('reference')
+        self.reference = ReplayReference(reference) if reference else None
+
+
+class ReplayHarness:
+
+    def __init__(self, ingestor=None, send_latency=0.0, fetch_latency=0.0):
+        self.ingestor = ingestor
+        self.send_latency = send_latency
+        self.fetch_latency = fetch_latency
+        self.channels = {}
+        self.messages = {}
+        self.sends = 0
+        self.fetches = 0
+
+    def channel(self, data):
+        key = data.get('id')
+        if key not in self.channels:
+            self.channels[key] = ReplayChannel(data, self)
+        return self.channels[key]
+
+    def load(self, path):
+        """Loads a recording, returning (received_at, message) pairs in recorded order."""
+        events = []
+        for event in read_events(path):
+            data = event['message']
+            resolved = (data.get('reference') or {}).get('resolved')
+            if resolved and resolved['id'] not in self.messages:
+                self.messages[resolved['id']] = ReplayMessage(resolved, self)
+            message = ReplayMessage(data, self)
+            self.messages[message.id] = message
+            events.append((event['received_at'], message))
+        return events
+
+    async def run(self, events, speed):
+        latencies = []
+
+        async def dispatch(message):
+            start = time.perf_counter()
+            result = await self.ingestor.process_message(message)
+            latencies.append(time.perf_counter() - start)
+            return result
+
+        tasks = []
+        start = time.perf_counter()
+        first_received = events[0][0] if events else 0
+        for received_at, message in events:
+            if speed > 0:
+                due = (received_at - first_received) / speed
+                delay = due - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # discord.py dispatches every on_message as its own task, so do the same
+            tasks.append(asyncio.create_task(dispatch(message)))
+            if speed == 0:
+                await asyncio.sleep(0)
+        results = await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+        return results, latencies, elapsed
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(results, latencies, elapsed, harness):
+    count = len(results)
+    processed = sum(1 for r in results if r)
+    print(f'Replayed {count} messages in {elapsed:.3f}s '
+          f'({count / elapsed if elapsed else 0:.1f} msg/s)')
+    print(f'Processed: {processed}, skipped: {count - processed}, '
+          f'sends: {harness.sends}, fetches: {harness.fetches}')
+    if latencies:
+        ms = [l * 1000 for l in latencies]
+        print(f'Latency ms: mean {statistics.mean(ms):.3f}, p50 {_percentile(ms, 50):.3f}, '
+              f'p95 {_percentile(ms, 95):.3f}, p99 {_percentile(ms, 99):.3f}, max {max(ms):.3f}')
+
+
+def set_up_guilds(db, events, vars):
+    """
+    Gives every recorded guild that doesn't have settings yet the channels and user from
+    the config, like the first start of the bot does.
+    """
+    for guild_id in {m.guild.id for _, m in events if m.guild}:
+        if db.get_guild_settings(guild_id) is None:
+            db.save_guild_settings(GuildSettings(guild_id,
+                                                 vars.get('track_list_channel', 'test-track-list'),
+                                                 vars.get('music_review_channel', 'test-music-review'),
+                                                 vars.get('controlling_user', 'longliveHIM')))
+
+
+def make_ingestor(db_path, live_spotify=False):
+    """Builds an Ingestor over db_path with the batch size from the current config."""
+    _, _, vars = load_config()
+    db = DBConnector(db_path)
+    db.create_tables()
+    journal = IngestJournal(db_path if db_path == ':memory:' else db_path.replace('.sqlite3', '-journal.sqlite3'))
+    journal.create_tables()
+    ingestor = Ingestor(db, None, search_index=GuildSearchIndexes(),
+                        batch_size=vars.get('backfill_batch_size', 500), ingest_journal=journal)
+    if not live_spotify:
+        ingestor.artist_lookup = lambda link: 'Replay Artist'
+        ingestor.artists_lookup = lambda links: {link: 'Replay Artist' for link in links}
+    return ingestor
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded Discord messages through process_message.')
+    parser.add_argument('recording', help='JSONL recording, optionally gzip compressed')
+    parser.add_argument('--speed', type=float, default=0,
+                        help='1 = real time, N = N times faster, 0 = as fast as possible (default)')
+    parser.add_argument('--db', default=':memory:', help='Database to ingest into (default: in memory)')
+    parser.add_argument('--send-latency', type=float, default=0.0, help='Simulated seconds per channel.send')
+    parser.add_argument('--fetch-latency', type=float, default=0.0, help='Simulated seconds per fetch_message')
+    parser.add_argument('--live-spotify', action='store_true',
+                        help='Call the Spotify API for missing authors instead of stubbing it')
+    args = parser.parse_args()
+
+    ingestor = make_ingestor(args.db, args.live_spotify)
+    logging.basicConfig(level=logging.WARNING)
+
+    harness = ReplayHarness(ingestor, args.send_latency, args.fetch_latency)
+    events = harness.load(args.recording)
+    set_up_guilds(ingestor.db, events, load_config()[2])
+    results, latencies, elapsed = asyncio.run(harness.run(events, args.speed))
+    report(results, latencies, elapsed, harness)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import re
+from dataclasses import dataclass
+
+import discord
+from discord.ui import View, Button, DynamicItem
+
+# Every menu button is a MenuButton whose custom_id carries the whole state of the screen
+# it leads to: "rdj:<action>:<kind>:<page>:<arg>|<arg>". The client registers MenuButton
+# once (client.add_dynamic_items), so any button on any menu message, including ones sent
+# before a restart, is rebuilt from its custom_id and handled here. Nothing is kept per menu.
+CUSTOM_ID_LIMIT = 100
+
+# Screen handlers by action, see screen(). Each is called as
+# handler(db, guild, kind, page, args) and returns a Screen.
+SCREENS = {}
+
+# Values too long for a custom_id, or that would break its parsing, are replaced with
+# "#<code><row id>", a row that holds the value. The code says which column to read.
+REFERENCE_COLUMNS = {
+    't': ('ratings', 'track_name'),
+    'b': ('ratings', 'recommended_by'),
+    'g': ('recommendations', 'genre1'),
+    'h': ('recommendations', 'genre2'),
+    'a': ('recommendations', 'tag'),
+}
+
+
+@dataclass(slots=True)
+class Screen:
+    content: str | None = None
+    embed: discord.Embed | None = None
+    view: View | None = None
+    error: str | None = None  # Sent only to the user who clicked, leaving the menu as it was
+
+
+def screen(action):
+    """Registers a screen handler for MenuButtons with this action."""
+    def register(handler):
+        SCREENS[action] = handler
+        return handler
+    return register
+
+
+def encode_args(db, guild_id, args, codes=()):
+    """
+    Joins args for a custom_id. codes[i] lists the REFERENCE_COLUMNS that may hold args[i],
+    used when the value can't be stored as it is.
+    """
+    # Leaves room for the longest "rdj:<action>:<kind>:<page>:" prefix
+    limit = (CUSTOM_ID_LIMIT - 40 - (len(args) - 1)) // max(len(args), 1)
+    encoded = []
+    for i, value in enumerate(args):
+        value = '' if value is None else str(value)
+        encoded.append(encode_value(db, guild_id, value, codes[i] if i < len(codes) else (), limit))
+    return '|'.join(encoded)
+
+
+def encode_value(db, guild_id, value, codes=(), limit=CUSTOM_ID_LIMIT):
+    """value, or a reference to a row holding it if it's longer than limit or looks like a reference."""
+    if len(value) > limit or '|' in value or value.startswith('#'):
+        for code in codes:
+            table, column = REFERENCE_COLUMNS[code]
+            row_id = db.find_value(guild_id, table, column, value)
+            if row_id is not None:
+                return f'#{code}{row_id}'
+    return value
+
+
+def decode_value(db, value):
+    """The value a reference made by encode_value refers to, None if the row is gone, else value itself."""
+    match = re.fullmatch(r'#([a-z])(\d+)', value)
+    if match and match.group(1) in REFERENCE_COLUMNS:
+        table, column = REFERENCE_COLUMNS[match.group(1)]
+        return db.get_value(table, column, int(match.group(2)))
+    return value
+
+
+def decode_args(db, encoded):
+    return [decode_value(db, value) for value in encoded.split('|')] if encoded else []
+
+
+def stateless_view(*items):
+    """
+    A View for sending only. It's stopped straight away so discord.py doesn't keep it in its
+    view store: clicks are routed to MenuButton by custom_id, not to this object.
+    """
+    view = View(timeout=None)
+    for item in items:
+        # None is a button that was dropped, see results_button
+        if item is not None:
+            view.add_item(item)
+    view.stop()
+    return view
+
+
+class MenuButton(DynamicItem[Button], template=r'rdj:(?P<action>[a-z_]+):(?P<kind>[a-z_]*):(?P<page>\d+):(?P<args>.*)'):
+
+    def __init__(self, label, action, kind='', page=0, args='', style=discord.ButtonStyle.secondary,
+                 row=None, disabled=False):
+        custom_id = f'rdj:{action}:{kind}:{page}:{args}'
+        if len(custom_id) > CUSTOM_ID_LIMIT:
+            # Cutting it short would open the wrong results, or none, when clicked
+            raise ValueError(f'custom_id is {len(custom_id)} characters, over the limit of {CUSTOM_ID_LIMIT}: {custom_id}')
+        super().__init__(Button(label=str(label)[:80], style=style, custom_id=custom_id, disabled=disabled),
+                         row=row)
+        self.action = action
+        self.kind = kind
+        self.page = page
+        self.args = args
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: Button, match: re.Match[str], /):
+        return cls(item.label, match['action'], match['kind'], int(match['page']), match['args'],
+                   style=item.style, disabled=item.disabled)
+
+    async def callback(self, interaction: discord.Interaction):
+        if self.action == 'close':
+            await interaction.response.edit_message(delete_after=1)
+            return
+        handler = SCREENS.get(self.action)
+        if handler is None:
+            await interaction.response.send_message("This menu is no longer supported, open a new one.",
+                                                    ephemeral=True)
+            return
+        if interaction.guild is None:
+            await interaction.response.send_message("Menus only work in servers.", ephemeral=True)
+            return
+        db = interaction.client.db
+        result = handler(db, interaction.guild, self.kind, self.page, decode_args(db, self.args))
+        if result.error:
+            await interaction.response.send_message(result.error, ephemeral=True)
+        else:
+            await interaction.response.edit_message(content=result.content, embed=result.embed, view=result.view)
+
+
+def close_button(row=None):
+    return MenuButton("Close", 'close', style=discord.ButtonStyle.danger, row=row)
+
+
+def back_button(action, row=None):
+    return MenuButton("Back", action, style=discord.ButtonStyle.danger, row=row)
+
+
+# Value menus (recommenders, genres, tags) show this many buttons a page: four full rows,
+# leaving the last row for Back / Previous / Next.
+VALUES_PER_PAGE = 20
+
+
+def value_menu(action, back_action, values, page, value_button):
+    """Buttons for one page of values, made by value_button(value), with paging and Back."""
+    page_count = max((len(values) + VALUES_PER_PAGE - 1) // VALUES_PER_PAGE, 1)
+    page = min(page, page_count - 1)
+    items = [value_button(value) for value in values[page * VALUES_PER_PAGE:(page + 1) * VALUES_PER_PAGE]]
+    items.append(back_button(back_action, row=4))
+    if page_count > 1:
+        items.append(MenuButton("Previous", action, page=max(page - 1, 0), row=4, disabled=page == 0))
+        items.append(MenuButton("Next", action, page=min(page + 1, page_count - 1), row=4,
+                                disabled=page == page_count - 1))
+    return stateless_view(*items)
+
+
+def display_name(value, guild):
+    # Genres are sometimes stored as role mentions, show the role name instead
+    match = re.fullmatch(r'<@&(\d+)>', value)
+    if match and guild:
+        role = guild.get_role(int(match.group(1)))
+        if role:
+            return role.name
+    return value
@@ -0,0 +1,112 @@
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+import discord
+from helpers.page_cache import PageCache
+from views.menu import MenuButton, Screen, screen, encode_args, stateless_view, close_button
+
+# Results per embed. Discord allows 25 fields, but reviews are long and the
+# whole embed has to stay under 6000 characters.
+PAGE_SIZE = 10
+
+# Rendered result pages shared by every results view. The bot sizes it from the config.
+result_pages = PageCache()
+
+
+@dataclass(slots=True)
+class ResultKind:
+    query: Callable  # (db, guild_id, *args) -> rows
+    build_table: Callable  # rows -> Embed
+    title: Callable  # (guild, *args) -> message content above the results
+    empty: Callable  # (guild, *args) -> message when there are none
+    references: tuple = ()  # REFERENCE_COLUMNS codes per arg, for values too long for a custom_id
+    prepare: Callable = lambda *args: args  # args -> the args the query and cache key use
+
+
+# Everything a results menu can show, by kind. views/ratings.py and views/recommendations.py add theirs.
+RESULT_KINDS = {}
+
+
+def get_page(db, key, page, query, build_table):
+    """
+    Returns (embed, page, page_count) for one page of a query's results, with embed None if
+    there are none. key identifies the query, e.g. ("rating", guild_id, 7). The query's rows
+    are cached once under (key, None) and each page is rendered when it's first asked for,
+    so paging stays in memory without one big result flushing the rest of the cache.
+    """
+    version = db.write_version()
+    cached = result_pages.get((key, page), version)
+    if cached is not None:
+        return cached
+    results = result_pages.get((key, None), version)
+    if results is None:
+        results = query()
+        result_pages.put((key, None), version, results)
+    page_count = (len(results) + PAGE_SIZE - 1) // PAGE_SIZE
+    # The results may have shrunk since the caller saw them
+    page = max(min(page, page_count - 1), 0)
+    embed = build_table(results[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]) if results else None
+    if embed is not None and page_count > 1:
+        embed.set_footer(text=f"Page {page + 1} of {page_count}. {embed.footer.text}")
+    rendered = (embed, page, page_count)
+    result_pages.put((key, page), version, rendered)
+    return rendered
+
+
+@screen('results')
+def results_screen(db, guild, kind, page, args):
+    """One page of results of the given kind, with Previous / Next / Close buttons."""
+    gone = Screen(error="These results are no longer available, open a new menu.")
+    result_kind = RESULT_KINDS.get(kind)
+    # None args are referenced rows that have been deleted since the menu was sent
+    if result_kind is None or None in args:
+        return gone
+    try:
+        prepared = result_kind.prepare(*args)
+    except (TypeError, ValueError, KeyError):
+        # Wrong args for the kind, e.g. a custom_id from an older version
+        return gone
+    guild_id = guild.id
+    embed, page, page_count = get_page(db, (kind, guild_id) + tuple(prepared), page,
+                                       lambda: result_kind.query(db, guild_id, *prepared),
+                                       result_kind.build_table)
+    if embed is None:
+        return Screen(error=result_kind.empty(guild, *args))
+    items = [close_button(row=1)]
+    if page_count > 1:
+        encoded = encode_args(db, guild_id, args, result_kind.references)
+        try:
+            items.append(MenuButton("Previous", 'results', kind, max(page - 1, 0), encoded, row=0, disabled=page == 0))
+            items.append(MenuButton("Next", 'results', kind, min(page + 1, page_count - 1), encoded, row=0,
+                                    disabled=page == page_count - 1))
+        except ValueError as e:
+            # An argument too long to store with no row to refer to instead, so show the first page only
+            logging.warning('Dropping paging buttons: %s', e)
+            items = items[:1]
+    return Screen(result_kind.title(guild, *args), embed, stateless_view(*items))
+
+
+def results_button(db, guild_id, label, kind, *args, row=None):
+    """
+    A button that opens the first page of results of this kind, or None if the args don't fit
+    in its custom_id, even as references. stateless_view leaves None out.
+    """
+    encoded = encode_args(db, guild_id, args, RESULT_KINDS[kind].references)
+    try:
+        return MenuButton(label, 'results', kind, 0, encoded, row=row)
+    except ValueError as e:
+        logging.warning('Dropping results button %r: %s', label, e)
+        return None
+
+
+async def send_results(interaction: discord.Interaction, db, kind, *args):
+    """Answers a slash command with the first page of results, or the empty message only to its user."""
+    if interaction.guild is None:
+        await interaction.response.send_message("This only works in servers.", ephemeral=True)
+        return
+    result = results_screen(db, interaction.guild, kind, 0, list(args))
+    if result.error:
+        await interaction.response.send_message(result.error, ephemeral=True)
+    else:
+        await interaction.response.send_message(result.content, embed=result.embed, view=result.view)
@@ -1,57 +1,79 @@
 import discord
-from discord.ui import View, Button
-from components.BackButton import BackButton
+from views.menu import Screen, screen, stateless_view, value_menu, back_button, MenuButton
+from views.pages import ResultKind, RESULT_KINDS, results_button
+from helpers.periods import PERIODS, period_start
 
 
 def _build_embed_table(results):
     embed = discord.Embed(title="Results", color=discord.Color.blue())
     for result in results:
         embed.add_field(
-            name=result['track_name'],
+            name=result.track_name,
             value=
-            f"Rating: {result['rating']}\nReview: {result['review']}\nRecommended By: {result['recommended_by']}",
+            f"Rating: {result.rating}\nReview: {result.review}\nRecommended By: {result.recommended_by}",
             inline=False)
     embed.set_footer(text="Click 'Close' to dismiss this message.")
     return embed
 
 
-class RatingsStartView(View):
-
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-
-        #self.add_item(discord.Button(label="Ratings", style=discord.ButtonStyle.primary, custom_id="ratings"))
-        #self.add_item(Button(label="Recommended By", style=discord.ButtonStyle.primary, custom_id="recommended"))
-
-    @discord.ui.button(label="Rating",
-                       style=discord.ButtonStyle.primary,
-                       custom_id="ratings")
-    async def ratings_callback(self, interaction: discord.Interaction,
-                               button: Button):
-        await interaction.response.edit_message(content="Select a rating:",
-                                                view=RatingsView(db=self.db))
-
-    @discord.ui.button(label="Recommended By",
-                       style=discord.ButtonStyle.primary,
-                       custom_id="recommended")
-    async def recommended_callback(self, interaction: discord.Interaction,
-                                   button: Button):
-        await interaction.response.edit_message(
-            content="View Songs Recommended By:", view=RecView(db=self.db))
-
-
-class RatingsView(View):
-
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-        for i in range(1, 11):
-            row = (i - 1) // 5  # Calculate row number based on index
-            self.add_item(RatingButton(i, db, row))
-        self.add_item(
-            BackButton(db, ((i + 1) // 5) + 1, RatingsStartView(db),
-                       "View Reviews By:"))
+RESULT_KINDS.update({
+    'rating': ResultKind(
+        query=lambda db, guild_id, rating: db.get_tracks_by_rating(guild_id, rating),
+        build_table=_build_embed_table,
+        title=lambda guild, rating: None,
+        empty=lambda guild, rating: f"No tracks found with rating {rating}.",
+        prepare=lambda rating: (int(rating),)),
+    'recommended_by': ResultKind(
+        query=lambda db, guild_id, name: db.get_tracks_by_recommended_by(guild_id, name),
+        build_table=_build_embed_table,
+        title=lambda guild, name: None,
+        empty=lambda guild, name: f"No tracks found recommended by {name}.",
+        references=(('b',),)),
+    'track_name': ResultKind(
+        query=lambda db, guild_id, track: db.get_tracks_by_track_name(guild_id, track),
+        build_table=_build_embed_table,
+        title=lambda guild, track: None,
+        empty=lambda guild, track: f"No ratings found for {track}.",
+        references=(('t',),)),
+    'ratings_since': ResultKind(
+        query=lambda db, guild_id, start: db.get_ratings_between(guild_id, start),
+        build_table=_build_embed_table,
+        title=lambda guild, period: f"Reviews {PERIODS[period].lower()}:",
+        empty=lambda guild, period: f"No reviews {PERIODS[period].lower()}.",
+        # The cache key uses the start, so pages roll over with the calendar
+        prepare=lambda period: (period_start(period),)),
+})
+
+
+@screen('ratings')
+def ratings_start(db, guild, kind, page, args):
+    return Screen("View Reviews By:", None, stateless_view(
+        MenuButton("Rating", 'rating_values', style=discord.ButtonStyle.primary),
+        MenuButton("Recommended By", 'recommenders', style=discord.ButtonStyle.primary),
+        MenuButton("Recent", 'ratings_periods', style=discord.ButtonStyle.primary)))
+
+
+@screen('rating_values')
+def rating_values(db, guild, kind, page, args):
+    # Ratings 1-10 in two rows of five
+    buttons = [results_button(db, guild.id, i, 'rating', i, row=(i - 1) // 5) for i in range(1, 11)]
+    return Screen("Select a rating:", None, stateless_view(*buttons, back_button('ratings', row=2)))
+
+
+@screen('recommenders')
+def recommenders(db, guild, kind, page, args):
+    guild_id = guild.id
+    names = sorted(filter(None, db.get_all_recommended_by(guild_id)), key=str.casefold)
+    return Screen("View Songs Recommended By:", None, value_menu(
+        'recommenders', 'ratings', names, page,
+        lambda name: results_button(db, guild_id, name, 'recommended_by', name)))
+
+
+@screen('ratings_periods')
+def ratings_periods(db, guild, kind, page, args):
+    buttons = [results_button(db, guild.id, label, 'ratings_since', period)
+               for period, label in PERIODS.items()]
+    return Screen("View Reviews From:", None, stateless_view(*buttons, back_button('ratings', row=1)))
 
 
 # class RatingsBackButton(Button):
@@ -62,27 +84,6 @@ class RatingsView(View):
 #     async def callback(self, interaction: discord.Interaction):
 #         await interaction.response.edit_message(content = "View Reviews By:", view=RatingsStartView(self.db))
 
-
-class RecView(View):
-
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-        recommended_by = db.get_all_recommended_by()
-        for i, name in enumerate(recommended_by):
-            self.add_item(RecButton(name, db))
-        self.add_item(
-            BackButton(db, 1, RatingsStartView(db), "View Reviews By:"))
-
-
-# class RecBackButton(Button):
-#     def __init__(self, db, row):
-#         super().__init__(label="Back", style=discord.ButtonStyle.danger, custom_id="back_rec", row = row)
-#         self.db = db
-
-#     async def callback(self, interaction: discord.Interaction):
-#         await interaction.response.edit_message(content = "View Reviews By:", view=RatingsStartView(self.db))
-
 #old shitty malformed table builder
 #def _build_embed_table(results):
 #    embed = discord.Embed(title="Results", description="Here are the results:", color=discord.Color.blue())
@@ -96,57 +97,3 @@ class RecView(View):
 #    embed.add_field(name="Recommended By", value=recomended_by, inline=True)
 #    embed.set_footer(text="Click 'Close' to dismiss this message.")
 #    return embed
-
-
-class RecButton(Button):
-
-    def __init__(self, name: str, db):
-        super().__init__(label=name,
-                         style=discord.ButtonStyle.secondary)
-        self.db = db
-        self.name = name
-
-    async def callback(self, interaction: discord.Interaction):
-        results = self.db.get_tracks_by_recommended_by(self.name)
-        if results:
-            embed = _build_embed_table(results)
-            await interaction.response.edit_message(content=None,
-                                                    embed=embed,
-                                                    view=ResultsTable())
-        else:
-            await interaction.response.send_message(
-                f"No tracks found recommended by {self.name}.", ephemeral=True)
-
-
-class RatingButton(Button):
-
-    def __init__(self, value: int, db, row):
-        super().__init__(label=str(value),
-                         style=discord.ButtonStyle.secondary,
-                         row=row)
-        self.db = db
-        self.value = value
-
-    async def callback(self, interaction: discord.Interaction):
-        results = self.db.get_tracks_by_rating(self.value)
-        if results:
-            embed = _build_embed_table(results)
-            await interaction.response.edit_message(content=None,
-                                                    embed=embed,
-                                                    view=ResultsTable())
-        else:
-            await interaction.response.send_message(
-                f"No tracks found with rating {self.value}.", ephemeral=True)
-
-
-class ResultsTable(View):
-
-    def __init__(self):
-        super().__init__()
-
-    @discord.ui.button(label="Close",
-                       style=discord.ButtonStyle.danger,
-                       custom_id="close")
-    async def close_callback(self, interaction: discord.Interaction,
-                             button: Button):
-        await interaction.response.edit_message(delete_after=1)
@@ -1,99 +1,86 @@
 import discord
-from discord.ui import View, Button
+from helpers.periods import PERIODS, period_start
+from views.menu import Screen, screen, stateless_view, value_menu, back_button, display_name, MenuButton
+from views.pages import ResultKind, RESULT_KINDS, results_button
 
 def _build_embed_table(recommendations):
     embed = discord.Embed(title="Results", color=discord.Color.blue())
     for rec in recommendations:
         embed.add_field(
-            name=rec['title'],
-            value=f"Author: {rec['author']}\nLink: {rec['link']}\nGenre: {rec['genre']}\nTag: {rec['tag']}",
+            name=rec.title,
+            value=f"Author: {rec.author}\nLink: {rec.link}\nGenre: {' '.join(filter(None, (rec.genre1, rec.genre2)))}\nTag: {rec.tag}",
             inline=False
         )
     embed.set_footer(text="Click 'Close' to dismiss this message.")
     return embed
 
-class RecommendationsStartView(View):
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-    
+def _get_recommendations(db, guild_id, genre, tag):
+    # Genre, tag or both, as picked in /recs
+    if tag:
+        results = db.get_recommendations_by_tag(guild_id, tag)
+        if genre:
+            results = [rec for rec in results if genre in (rec.genre1, rec.genre2)]
+        return results
+    return db.get_recommendations_by_genre(guild_id, genre)
 
-    @discord.ui.button(label="Genre", style=discord.ButtonStyle.primary, custom_id="genre")
-    async def genre_callback(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.edit_message(
-            content="Select a genre:", view=GenreView(db=self.db)
-        )
-    
-    @discord.ui.button(label="Tag", style=discord.ButtonStyle.primary, custom_id="tag")
-    async def tag_callback(self, interaction: discord.Interaction, button: Button): 
-        await interaction.response.edit_message(
-            content="Select a tag:", view=TagView(db=self.db)
-        )
-
-class GenreView(View):
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-        genres = db.get_all_genres()
-        for i, genre in enumerate(genres):
-            self.add_item(GenreButton(genre, db))
-        self.add_item(GenreBackButton(db, 1))
-
-class GenreButton(Button):
-    def __init__(self, genre, db):
-        super().__init__(label=genre, style=discord.ButtonStyle.primary, custom_id=f"genre_{genre}")
-        self.db = db
-        self.genre = genre
-
-    async def callback(self, interaction: discord.Interaction):
-        recommendations = self.db.get_recommendations_by_genre(self.genre)
-        embed = _build_embed_table(recommendations)
-        await interaction.response.edit_message(
-            content=f"Recommendations for {self.genre}:", embed = embed, view=RecommendationsView()
-        )
+def _label(guild, *values):
+    return ' / '.join(display_name(v, guild) for v in values if v)
 
-class GenreBackButton(Button):
-    def __init__(self, db, row):
-        super().__init__(label="Back", style=discord.ButtonStyle.danger, custom_id="back_genre", row=row)
-        self.db = db
-
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.edit_message(content="View Recommendations By:", view=RecommendationsStartView(self.db))
-
-class TagView(View):
-    def __init__(self, db):
-        super().__init__()
-        self.db = db
-        tags = db.get_all_tags()
-        for i, tag in enumerate(tags):
-            self.add_item(TagButton(tag, db, 0))
-        self.add_item(TagBackButton(db, 1))
-
-class TagButton(Button):
-    def __init__(self, tag, db, row):
-        super().__init__(label=tag, style=discord.ButtonStyle.primary, custom_id=f"tag_{tag}", row=row)
-        self.db = db
-        self.tag = tag
-
-    async def callback(self, interaction: discord.Interaction):
-        recommendations = self.db.get_recommendations_by_tag(self.tag)
-        embed = _build_embed_table(recommendations)
-        await interaction.response.edit_message(
-            content=f"Recommendations for {self.tag}:", embed=embed, view=RecommendationsView()
-        )
+RESULT_KINDS.update({
+    'genre': ResultKind(
+        query=lambda db, guild_id, genre: db.get_recommendations_by_genre(guild_id, genre),
+        build_table=_build_embed_table,
+        title=lambda guild, genre: f"Recommendations for {_label(guild, genre)}:",
+        empty=lambda guild, genre: f"No recommendations found for {_label(guild, genre)}.",
+        references=(('g', 'h'),)),
+    'tag': ResultKind(
+        query=lambda db, guild_id, tag: db.get_recommendations_by_tag(guild_id, tag),
+        build_table=_build_embed_table,
+        title=lambda guild, tag: f"Recommendations for {_label(guild, tag)}:",
+        empty=lambda guild, tag: f"No recommendations found for {_label(guild, tag)}.",
+        references=(('a',),)),
+    'recs': ResultKind(
+        query=_get_recommendations,
+        build_table=_build_embed_table,
+        title=lambda guild, genre, tag: f"Recommendations for {_label(guild, genre, tag)}:",
+        empty=lambda guild, genre, tag: f"No recommendations found for {_label(guild, genre, tag)}.",
+        references=(('g', 'h'), ('a',))),
+    'recommendations_since': ResultKind(
+        query=lambda db, guild_id, start: db.get_recommendations_between(guild_id, start),
+        build_table=_build_embed_table,
+        title=lambda guild, period: f"Recommendations {PERIODS[period].lower()}:",
+        empty=lambda guild, period: f"No recommendations {PERIODS[period].lower()}.",
+        prepare=lambda period: (period_start(period),)),
+})
 
-class TagBackButton(Button):
-    def __init__(self, db, row):
-        super().__init__(label="Back", style=discord.ButtonStyle.danger, custom_id="back_tag", row=row)
-        self.db = db
+@screen('recommendations')
+def recommendations_start(db, guild, kind, page, args):
+    return Screen("View Recommendations By:", None, stateless_view(
+        MenuButton("Genre", 'genres', style=discord.ButtonStyle.primary),
+        MenuButton("Tag", 'tags', style=discord.ButtonStyle.primary),
+        MenuButton("Recent", 'recommendations_periods', style=discord.ButtonStyle.primary)
+    ))
 
-    async def callback(self, interaction: discord.Interaction):
-        await interaction.response.edit_message(content="Select a tag:", view=RecommendationsStartView(self.db))
+@screen('genres')
+def genres(db, guild, kind, page, args):
+    guild_id = guild.id
+    values = sorted(filter(None, db.get_all_genres(guild_id)), key=lambda v: display_name(v, guild).casefold())
+    return Screen("Select a genre:", None, value_menu(
+        'genres', 'recommendations', values, page,
+        lambda genre: results_button(db, guild_id, display_name(genre, guild), 'genre', genre)
+    ))
 
-class RecommendationsView(View):
-    def __init__(self):
-        super().__init__()
+@screen('tags')
+def tags(db, guild, kind, page, args):
+    guild_id = guild.id
+    values = sorted(filter(None, db.get_all_tags(guild_id)), key=lambda v: display_name(v, guild).casefold())
+    return Screen("Select a tag:", None, value_menu(
+        'tags', 'recommendations', values, page,
+        lambda tag: results_button(db, guild_id, display_name(tag, guild), 'tag', tag)
+    ))
 
-    @discord.ui.button(label="Close", style=discord.ButtonStyle.danger, custom_id="close")
-    async def close_callback(self, interaction: discord.Interaction, button: Button):
-        await interaction.response.edit_message(delete_after=1)
\ No newline at end of file
+@screen('recommendations_periods')
+def recommendations_periods(db, guild, kind, page, args):
+    buttons = [results_button(db, guild.id, label, 'recommendations_since', period)
+               for period, label in PERIODS.items()]
+    return Screen("View Recommendations From:", None, stateless_view(*buttons, back_button('recommendations', row=1)))
@@ -0,0 +1,195 @@
+"""
+Ingest worker for the split deployment. Run it next to the bot with ingest_mode set to
+"worker" (or INGEST_MODE=worker):
+
+    python ./src/worker.py
+
+The bot queues live messages, process and backup requests in the job table. This process
+claims them, does the Discord history reads, Spotify lookups and SQLite writes, and records
+progress on the job row, which the bot reports back to the channel the command came from.
+Messages that couldn't be archived are retried from the ingest journal in the background.
+It only talks to Discord over REST, so it doesn't open a second gateway session.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+
+import discord
+
+from db.backup import BackupManager
+from db.db_connector import DBConnector
+from db.jobs import JobQueue
+from db.journal import IngestJournal
+from helpers.config import load_config
+from helpers.logs import setup_logging
+from ingest import Ingestor
+
+
+class IngestWorker:
+
+    def __init__(self, db, jobs, ingestor, backups, poll_seconds=1.0, backup_interval_hours=24,
+                 retry_seconds=60, journal_keep_days=30, message_concurrency=8):
+        self.db = db
+        self.jobs = jobs
+        self.ingestor = ingestor
+        self.backups = backups
+        self.client = ingestor.client
+        self.poll_seconds = poll_seconds
+        self.backup_interval_hours = backup_interval_hours
+        self.retry_seconds = retry_seconds
+        self.journal_keep_days = journal_keep_days
+        self.message_concurrency = message_concurrency
+        self.settings_version = None
+
+    async def run(self, token):
+        await self.client.login(token)
+        requeued = self.jobs.requeue_running()
+        if requeued:
+            logging.info('Requeued %s jobs left running by a previous worker', requeued)
+        try:
+            # Live messages get their own consumer so a long backfill doesn't hold them up, and
+            # run several at a time like the bot's on_message tasks, since each may wait for its embed
+            await asyncio.gather(self.consume(('message',), self.message_concurrency),
+                                 self.consume(('backfill', 'backup')),
+                                 self.schedule_backups(),
+                                 self.schedule_retries())
+        finally:
+            await self.client.close()
+
+    async def consume(self, kinds, concurrency=1):
+        """Claims jobs of these kinds as they're queued, running up to `concurrency` at once."""
+        slots = asyncio.Semaphore(concurrency)
+        running = set()
+
+        def release(task):
+            running.discard(task)
+            slots.release()
+
+        while True:
+            await slots.acquire()
+            job = self.jobs.claim_next(kinds)
+            if job is None:
+                slots.release()
+                await asyncio.sleep(self.poll_seconds)
+                continue
+            task = asyncio.create_task(self.run_job(job))
+            running.add(task)
+            task.add_done_callback(release)
+
+    async def run_job(self, job):
+        try:
+            if job.kind == 'message':
+                status, result = await self.run_message(job)
+            elif job.kind == 'backfill':
+                status, result = await self.run_backfill(job)
+            else:
+                status, result = 'done', (await self.backups.run()).summary()
+            self.jobs.finish(job.id, status, result)
+        except Exception as e:
+            logging.error('Error running %s job %s: %s', job.kind, job.id, e)
+            self.jobs.finish(job.id, 'failed', str(e))
+
+    def refresh_settings(self):
+        """
+        Guild settings are saved by the bot, so drop the ingestor's cached ones once it has
+        written. Only other connections change data_version, and the bot's settings and
+        legacy rows are the only other writes to the archive.
+        """
+        version = self.db.data_version()
+        if version != self.settings_version:
+            self.settings_version = version
+            self.ingestor.forget_settings()
+
+    async def run_message(self, job):
+        self.refresh_settings()
+        try:
+            channel = await self.client.fetch_channel(job.channel_id)
+            message = await channel.fetch_message(job.message_id)
+            if not message.embeds and message.created_at + timedelta(seconds=60) > datetime.now(timezone.utc):
+                # There's no gateway here to update the message in place, so wait for the embed and fetch again
+                await asyncio.sleep(5)
+                message = await channel.fetch_message(job.message_id)
+        except Exception as e:
+            # The bot journaled the message when it queued the job, so the retrier takes it from here
+            self.ingestor.finish_journal(job.message_id, (f'Could not fetch the message: {e}', True))
+            raise
+        # Already waited for the embed above, don't wait again
+        if await self.ingestor.process_message(message, wait_for_embed=False):
+            return 'done', None
+        return 'skipped', None
+
+    async def run_backfill(self, job):
+        self.refresh_settings()
+        # Only the guild the process command came from
+        guild = (await self.client.fetch_channel(job.channel_id)).guild
+        settings = self.db.get_guild_settings(guild.id)
+        if settings is None:
+            return 'failed', "This server isn't set up yet. Use `configure` first."
+        names = (settings.track_list_channel, settings.music_review_channel)
+        channels = [ch for ch in await guild.fetch_channels()
+                    if ch.name in names and isinstance(ch, discord.TextChannel)]
+        if not channels:
+            return 'failed', f'Target channels {names[0]} and {names[1]} not found!'
+
+        async def on_progress(stats):
+            self.jobs.update_progress(job.id, stats)
+
+        stats = await self.ingestor.backfill(channels, on_progress=on_progress)
+        self.jobs.update_progress(job.id, stats)
+        logging.info('Historical processing complete: %s processed, %s already archived, %s skipped.',
+                     stats.processed, stats.duplicates, stats.skipped)
+        return 'done', None
+
+    async def schedule_backups(self):
+        if not self.backup_interval_hours:
+            return
+        while True:
+            await asyncio.sleep(self.backup_interval_hours * 3600)
+            try:
+                await self.backups.run()
+            except Exception as e:
+                logging.error('Error running scheduled backup: %s', e)
+
+    async def schedule_retries(self):
+        if not self.retry_seconds:
+            return
+        while True:
+            await asyncio.sleep(self.retry_seconds)
+            try:
+                await self.ingestor.retry_journal(self.journal_keep_days)
+            except Exception as e:
+                logging.error('Error retrying failed messages: %s', e)
+
+
+def main():
+    environment, db_path, vars = load_config()
+    setup_logging(level=logging.INFO,
+                  log_format=vars.get('log_format', 'json'),
+                  sample_rates=vars.get('log_sample_rates'),
+                  rate_limits=vars.get('log_rate_limits'))
+    logging.info('Ingest worker running in %s mode', environment)
+
+    db = DBConnector(db_path)
+    db.create_tables()
+    jobs = JobQueue(db_path.replace('.sqlite3', '-jobs.sqlite3'))
+    jobs.create_tables()
+    journal = IngestJournal(db_path.replace('.sqlite3', '-journal.sqlite3'))
+    journal.create_tables()
+
+    client = discord.Client(intents=discord.Intents.none())
+    ingestor = Ingestor(db, client, batch_size=vars.get('backfill_batch_size', 500), ingest_journal=journal)
+    backups = BackupManager(db, vars.get('backup_dir', 'db/backups'), keep=vars.get('backup_keep', 7))
+    worker = IngestWorker(db, jobs, ingestor, backups,
+                          backup_interval_hours=vars.get('backup_interval_hours', 24),
+                          retry_seconds=vars.get('ingest_retry_seconds', 60),
+                          journal_keep_days=vars.get('journal_keep_days', 30),
+                          message_concurrency=vars.get('message_concurrency', 8))
+    try:
+        asyncio.run(worker.run(os.getenv('DISCORD_TOKEN', 'PUT YOUR TOKEN IN THE ENV FILE YOU DUMB IDIOT DUMMY')))
+    except discord.LoginFailure as e:
+        logging.error('Worker Login Failure: %s', e)
+
+
+if __name__ == '__main__':
+    main()